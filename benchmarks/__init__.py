@@ -0,0 +1 @@
+"""synthetic-store benchmarks for the local_chamber backends; run with python -m benchmarks"""
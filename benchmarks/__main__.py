@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import click
+
+from .fakevault import FakeVault
+from .store import StoreShape
+from .suite import BACKENDS, OPERATIONS, BenchmarkSuite, report
+
+
+@click.command("benchmarks")
+@click.option(
+    "-b",
+    "--backend",
+    "backends",
+    multiple=True,
+    type=click.Choice(list(BACKENDS)),
+    help="backend to time [default: envdir, file, sqlite]",
+)
+@click.option(
+    "-o", "--operation", "operations", multiple=True, type=click.Choice(list(OPERATIONS)), help="operation to time [default: all]"
+)
+@click.option("--services", type=click.IntRange(min=1), default=100, show_default=True, help="top-level services")
+@click.option("--depth", type=click.IntRange(min=1), default=2, show_default=True, help="nesting levels per top-level service")
+@click.option("--keys", type=click.IntRange(min=1), default=10, show_default=True, help="secrets per service")
+@click.option("--value-size", type=click.IntRange(min=1), default=32, show_default=True, help="characters per secret value")
+@click.option("--seed", type=int, default=0, show_default=True, help="random seed for secret values")
+@click.option("-r", "--repeat", type=click.IntRange(min=1), default=3, show_default=True, help="timings per operation")
+@click.option("-j", "--jobs", type=click.IntRange(min=1), default=1, show_default=True, help="jobs for find -v and backup")
+@click.option(
+    "--vault-root",
+    default="bench",
+    show_default=True,
+    envvar="BENCH_VAULT_ROOT",
+    show_envvar=True,
+    help="vault KV v2 mount to use; its contents are DELETED",
+)
+@click.option(
+    "--fake-vault-latency",
+    type=click.FloatRange(min=0),
+    help="time vault against an in-process fake KV v2 server adding this many milliseconds per request",
+)
+@click.option("--vault-concurrency", type=click.IntRange(min=1), help="maximum concurrent vault requests")
+@click.option("-O", "--output", type=click.File("w"), default="-", help="JSON results file [default: stdout]")
+def benchmarks(
+    backends,
+    operations,
+    services,
+    depth,
+    keys,
+    value_size,
+    seed,
+    repeat,
+    jobs,
+    vault_root,
+    fake_vault_latency,
+    vault_concurrency,
+    output,
+):
+    """time local_chamber operations against synthetic stores and emit JSON results
+
+    With --fake-vault-latency the vault backend runs against an in-process fake server, and each
+    vault timing also records the requests one run of the operation made.
+    """
+    shape = StoreShape(services=services, depth=depth, keys=keys, value_size=value_size, seed=seed)
+    results = {}
+    vault = None
+    environ = dict(os.environ)
+    if fake_vault_latency is not None:
+        vault = FakeVault(latency=fake_vault_latency / 1000).start()
+        os.environ["VAULT_ADDR"] = vault.url
+        os.environ.setdefault("VAULT_TOKEN", "fake-vault-token")
+    try:
+        with tempfile.TemporaryDirectory(prefix="local_chamber-bench-") as workdir:
+            for backend in backends or ["envdir", "file", "sqlite"]:
+                backend_dir = Path(workdir) / backend
+                backend_dir.mkdir()
+                (backend_dir / "secrets.json").write_text("{}\n")
+                config = {
+                    "dir": backend_dir / "secrets",
+                    "file": backend_dir / "secrets.json",
+                    "sqlite": backend_dir / "secrets.db",
+                    "root": vault_root,
+                }
+                if vault_concurrency:
+                    config["vault_concurrency"] = vault_concurrency
+                suite = BenchmarkSuite(
+                    backend=backend,
+                    config=config,
+                    shape=shape,
+                    workdir=backend_dir,
+                    repeat=repeat,
+                    jobs=jobs,
+                    vault=vault if backend == "vault" else None,
+                )
+                results[backend] = suite.run(operations)
+                for name, timing in results[backend]["operations"].items():
+                    click.echo(f"{backend}\t{name}\t{timing['median'] * 1000:.2f}ms", err=True)
+    finally:
+        if vault is not None:
+            vault.stop()
+            os.environ.clear()
+            os.environ.update(environ)
+    json.dump(report(shape, repeat, results), output, indent=2)
+    output.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(benchmarks())
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+
+import json
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def _now():
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def _version_metadata(record, version):
+    return {"created_time": record["versions"][version - 1]["created_time"], "deletion_time": "", "destroyed": False}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """route /v1/<mount>/<data|metadata>/<path> requests to the owning FakeVault"""
+
+    protocol_version = "HTTP/1.1"
+    # headers and body are separate writes; without this, delayed ACKs add ~40ms per request
+    disable_nagle_algorithm = True
+    vault = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=None):
+        data = b"" if body is None else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _request(self, method):
+        url = urlparse(self.path)
+        parts = [part for part in url.path.split("/") if part]
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if method == "GET" and parse_qs(url.query).get("list"):
+            method = "LIST"
+        if len(parts) < 3 or parts[0] != "v1":
+            return self._send(404, {"errors": [f"no handler for route '{url.path}'"]})
+        self._send(*self.vault.handle(method, parts[1], parts[2], "/".join(parts[3:]), body))
+
+    def do_GET(self):
+        self._request("GET")
+
+    def do_LIST(self):
+        self._request("LIST")
+
+    def do_POST(self):
+        self._request("POST")
+
+    def do_PUT(self):
+        self._request("PUT")
+
+    def do_DELETE(self):
+        self._request("DELETE")
+
+
+class FakeVault:
+    """in-process HTTP stand-in for the Vault KV v2 endpoints used by VaultSecrets
+
+    Serves LIST and GET on metadata, GET and POST on data, and DELETE on metadata for any mount,
+    keeping every version of each secret in memory.  Each request sleeps latency seconds before
+    it is answered, to model a network round trip, and is counted by "<METHOD> <endpoint>" in
+    counts; max_inflight records the most requests that were ever being served at once.
+    """
+
+    def __init__(self, latency=0.0, host="127.0.0.1", port=0):
+        self.latency = latency
+        self.store = {}
+        self.counts = Counter()
+        self.inflight = 0
+        self.max_inflight = 0
+        self.lock = threading.Lock()
+        handler = type("Handler", (_Handler,), {"vault": self})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def requests(self):
+        """total requests served since the last reset"""
+        return sum(self.counts.values())
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True, name="fakevault")
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, _, ex, tb):
+        self.stop()
+
+    def reset(self):
+        """zero the request counters"""
+        with self.lock:
+            self.counts.clear()
+            self.max_inflight = self.inflight
+
+    def handle(self, method, mount, endpoint, path, body):
+        """return (status, body) for one request"""
+        with self.lock:
+            self.counts[f"{method} {endpoint}"] += 1
+            self.inflight += 1
+            self.max_inflight = max(self.max_inflight, self.inflight)
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            route = getattr(self, f"_{method.lower()}_{endpoint}", None)
+            if route is None:
+                return 405, {"errors": [f"unsupported request: {method} {endpoint}"]}
+            with self.lock:
+                return route(mount, path.strip("/"), body)
+        finally:
+            with self.lock:
+                self.inflight -= 1
+
+    def _list_metadata(self, mount, path, body):
+        prefix = path + "/" if path else ""
+        keys = set()
+        for _mount, _path in self.store:
+            if _mount == mount and _path.startswith(prefix):
+                head, sep, _ = _path[len(prefix) :].partition("/")
+                keys.add(head + sep)
+        if not keys:
+            return 404, {"errors": []}
+        return 200, {"data": {"keys": sorted(keys)}}
+
+    def _get_data(self, mount, path, body):
+        record = self.store.get((mount, path))
+        if record is None:
+            return 404, {"errors": []}
+        version = len(record["versions"])
+        metadata = dict(_version_metadata(record, version), version=version, custom_metadata=None)
+        return 200, {"data": {"data": record["versions"][-1]["data"], "metadata": metadata}}
+
+    def _post_data(self, mount, path, body):
+        record = self.store.setdefault((mount, path), {"created_time": _now(), "versions": []})
+        record["versions"].append({"data": body["data"], "created_time": _now()})
+        version = len(record["versions"])
+        return 200, {"data": dict(_version_metadata(record, version), version=version)}
+
+    _put_data = _post_data
+
+    def _get_metadata(self, mount, path, body):
+        record = self.store.get((mount, path))
+        if record is None:
+            return 404, {"errors": []}
+        versions = {str(version): _version_metadata(record, version) for version in range(1, len(record["versions"]) + 1)}
+        return 200, {
+            "data": {
+                "created_time": record["created_time"],
+                "updated_time": record["versions"][-1]["created_time"],
+                "current_version": len(record["versions"]),
+                "versions": versions,
+                "custom_metadata": None,
+            }
+        }
+
+    def _delete_metadata(self, mount, path, body):
+        self.store.pop((mount, path), None)
+        return 204, None
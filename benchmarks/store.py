@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+
+import random
+import string
+
+
+class StoreShape:
+    """dimensions of a synthetic secrets store
+
+    services top-level services each head a chain of depth nested services
+    (svc0000, svc0000/sub1, svc0000/sub1/sub2, ...), every one holding keys
+    secrets of value_size characters.
+    """
+
+    def __init__(self, services=10, depth=2, keys=10, value_size=32, seed=0):
+        self.services = services
+        self.depth = depth
+        self.keys = keys
+        self.value_size = value_size
+        self.seed = seed
+
+    def as_dict(self):
+        return dict(services=self.services, depth=self.depth, keys=self.keys, value_size=self.value_size, seed=self.seed)
+
+    @property
+    def total_services(self):
+        return self.services * self.depth
+
+    @property
+    def total_secrets(self):
+        return self.total_services * self.keys
+
+
+def service_names(shape):
+    """return the service paths of shape, parents before children"""
+    names = []
+    for index in range(shape.services):
+        path = f"svc{index:04d}"
+        names.append(path)
+        for level in range(1, shape.depth):
+            path = f"{path}/sub{level}"
+            names.append(path)
+    return names
+
+
+def generate_store(shape):
+    """return a deterministic {service: {key: value}} dict of the given shape"""
+    rand = random.Random(shape.seed)
+    alphabet = string.ascii_letters + string.digits
+    store = {}
+    for service in service_names(shape):
+        store[service] = {f"key{index:03d}": "".join(rand.choices(alphabet, k=shape.value_size)) for index in range(shape.keys)}
+    return store
+
+
+def populate(chamber, store):
+    """replace the contents of chamber with store, one batch write per service"""
+    chamber.clear()
+    for service, secrets in store.items():
+        chamber.write_service(service, secrets)
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+
+import io
+import platform
+import statistics
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+from local_chamber.archive import Backup, Restore
+from local_chamber.chamber import (
+    EnvdirChamber,
+    FileChamber,
+    SqliteChamber,
+    VaultChamber,
+)
+from local_chamber.version import __version__
+
+from .store import generate_store, populate
+
+BACKENDS = {"envdir": EnvdirChamber, "file": FileChamber, "vault": VaultChamber, "sqlite": SqliteChamber}
+
+
+def _quiet(*args, **kwargs):
+    pass
+
+
+def _read(chamber, bench):
+    chamber.read(bench.leaf, bench.key, quiet=True)
+
+
+def _env(chamber, bench):
+    chamber.env(bench.leaf)
+
+
+def _exec_env(chamber, bench):
+    # assemble the child environment exactly as exec does, without spawning the child
+    chamber._exec_subprocess = lambda child, buffer_output, env, cmd: SimpleNamespace(returncode=0)
+    chamber._exec(services=[bench.top, bench.leaf], cmd=["true"])
+
+
+def _list(chamber, bench):
+    chamber.list(bench.leaf)
+
+
+def _list_services(chamber, bench):
+    chamber.list_services(include_secrets=True)
+
+
+def _find(chamber, bench):
+    chamber.find(bench.key, by_value=False)
+
+
+def _find_value(chamber, bench):
+    chamber.find(bench.value, by_value=True, jobs=bench.jobs)
+
+
+def _export_tree(chamber, bench):
+    chamber.export(output_file=io.StringIO(), fmt="json", service=bench.top, tree=True)
+
+
+def _prune(chamber, bench):
+    chamber.prune(bench.top)
+
+
+def _prune_reset(chamber, bench):
+    for service in bench.subtree:
+        chamber.write_service(service, bench.store[service])
+
+
+def _backup(chamber, bench):
+    Backup(chamber=chamber, output_path=bench.workdir, file_name="bench.tgz", jobs=bench.jobs).write()
+
+
+def _restore(chamber, bench):
+    Restore(chamber=chamber, tarball=bench.workdir / "bench.tgz", patch=False, echo=_quiet).read()
+
+
+# operation name -> (timed function, untimed reset run after each timing or None)
+OPERATIONS = {
+    "read": (_read, None),
+    "env": (_env, None),
+    "exec-env": (_exec_env, None),
+    "list": (_list, None),
+    "list-services-s": (_list_services, None),
+    "find": (_find, None),
+    "find-v": (_find_value, None),
+    "export-tree": (_export_tree, None),
+    "prune": (_prune, _prune_reset),
+    "backup": (_backup, None),
+    "restore": (_restore, None),
+}
+
+
+class BenchmarkSuite:
+    """time chamber operations against one backend populated with a synthetic store
+
+    Every timing opens a fresh chamber, runs one operation and closes it, as a single cli
+    invocation would; output goes to a no-op echo so terminal speed is not measured.  Given the
+    FakeVault a vault backend talks to, timings also report the requests of the last run.
+    """
+
+    def __init__(self, *, backend, config, shape, workdir, repeat=3, jobs=1, vault=None):
+        self.backend = backend
+        self.vault = vault
+        self.config = config
+        self.shape = shape
+        self.repeat = repeat
+        self.store = generate_store(shape)
+        services = list(self.store)
+        top = services[len(services) // 2].split("/")[0]
+        leaf = [service for service in services if service.split("/")[0] == top][-1]
+        key = sorted(self.store[leaf])[-1]
+        self.bench = SimpleNamespace(
+            store=self.store,
+            top=top,
+            leaf=leaf,
+            subtree=[service for service in services if service == top or service.startswith(top + "/")],
+            key=key,
+            value=self.store[leaf][key],
+            workdir=workdir,
+            jobs=jobs,
+        )
+
+    def _open(self):
+        return BACKENDS[self.backend](config=self.config, debug=False, echo=_quiet, require_exists=True)
+
+    def setup(self):
+        """populate the store and write the tarball restore reads back; return the seconds taken"""
+        start = time.perf_counter()
+        with self._open() as chamber:
+            populate(chamber, self.store)
+        with self._open() as chamber:
+            _backup(chamber, self.bench)
+        return time.perf_counter() - start
+
+    def time(self, name):
+        """return {min, median, max} seconds over repeat runs of operation name"""
+        func, reset = OPERATIONS[name]
+        runs = []
+        for _ in range(self.repeat):
+            if self.vault is not None:
+                self.vault.reset()
+            start = time.perf_counter()
+            with self._open() as chamber:
+                func(chamber, self.bench)
+            runs.append(time.perf_counter() - start)
+            requests = None if self.vault is None else dict(self.vault.counts)
+            if reset is not None:
+                with self._open() as chamber:
+                    reset(chamber, self.bench)
+        timing = dict(min=min(runs), median=statistics.median(runs), max=max(runs))
+        if self.vault is not None:
+            timing["requests"] = requests
+        return timing
+
+    def run(self, operations=None):
+        """return {"setup": seconds, "operations": {name: timings}} for each selected operation"""
+        setup = self.setup()
+        timings = {name: self.time(name) for name in operations or OPERATIONS}
+        return dict(setup=setup, operations=timings)
+
+
+def report(shape, repeat, results):
+    """return the JSON-ready benchmark report"""
+    return dict(
+        version=__version__,
+        python=platform.python_version(),
+        platform=platform.platform(),
+        created=datetime.now().isoformat(timespec="seconds"),
+        shape=dict(shape.as_dict(), total_services=shape.total_services, total_secrets=shape.total_secrets),
+        repeat=repeat,
+        results=results,
+    )
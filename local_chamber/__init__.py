@@ -1,8 +1,28 @@
 """Top-level package for local-chamber."""
 
-from .chamber import ChamberError, EnvdirChamber, FileChamber, VaultChamber
-from .cli import cli
-from .vault import VaultSecrets
-from .version import __version__
+import time
 
-__all__ = ["cli", "EnvdirChamber", "FileChamber", "VaultChamber", "ChamberError", "VaultSecrets", __version__]
+# start of the package import, which --timings reports as the "import" phase
+IMPORT_STARTED = time.perf_counter()
+
+from .chamber import (  # noqa: E402
+    ChamberError,
+    EnvdirChamber,
+    FileChamber,
+    SqliteChamber,
+    VaultChamber,
+)
+from .cli import cli  # noqa: E402
+from .version import __version__  # noqa: E402
+
+
+def __getattr__(name):
+    # import the vault client (and hvac) only when it is used
+    if name == "VaultSecrets":
+        from .vault import VaultSecrets
+
+        return VaultSecrets
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+__all__ = ["cli", "EnvdirChamber", "FileChamber", "SqliteChamber", "VaultChamber", "ChamberError", "VaultSecrets", __version__]
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import socket
+import stat
+import struct
+import threading
+from os import chmod, environ, getpid, getuid, umask, unlink
+from pathlib import Path
+
+from .chamber import Chamber
+from .exception import ChamberError
+
+# cli commands that only read secrets, and so may be served by a running agent
+AGENT_COMMANDS = ["env", "exec", "export", "find", "list", "list-services", "read"]
+
+
+def default_socket_path(backend):
+    if environ.get("XDG_RUNTIME_DIR"):
+        return Path(environ["XDG_RUNTIME_DIR"]) / "local_chamber" / f"{backend}.sock"
+    # directly under the sticky /tmp, so a directory pre-created by another user is refused, not traversed
+    return Path(f"/tmp/local_chamber-{getuid()}") / f"{backend}.sock"
+
+
+def _owned(path, kind, mode=None):
+    """return True if path, not followed if a symlink, is a kind (stat.S_ISDIR, ...) owned by this user with mode"""
+    try:
+        st = Path(path).lstat()
+    except FileNotFoundError:
+        return False
+    return kind(st.st_mode) and st.st_uid == getuid() and (mode is None or stat.S_IMODE(st.st_mode) == mode)
+
+
+def _peer_uid(sock):
+    """return the uid of the process on the other end of a connected Unix socket, or None where unsupported"""
+    if not hasattr(socket, "SO_PEERCRED"):
+        return None
+    ucred = struct.Struct("3i")
+    return ucred.unpack(sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, ucred.size))[1]
+
+
+def store_fingerprint(backend, config):
+    """return a digest identifying the store a backend class opens with config"""
+    identity = [backend.__name__] + backend.store_identity(config)
+    return hashlib.sha256(json.dumps(identity).encode()).hexdigest()
+
+
+def _result(value):
+    """return a JSON-ready copy of a backend primitive's result"""
+    if isinstance(value, tuple):
+        return [_result(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _result(v) for k, v in value.items()}
+    if isinstance(value, (str, int, float, bool, list)) or value is None:
+        return value
+    return str(value)
+
+
+class AgentClient(Chamber):
+    """Chamber whose read primitives are served by a running agent over its Unix socket
+
+    Service verification, formatting and exec run in the client exactly as they do against a
+    local backend; each primitive is a single newline-delimited JSON request.  A client only
+    uses a socket owned by its own user, in a directory only that user can enter, whose agent
+    runs as that user and serves the same store its own backend and config would open.
+    """
+
+    def __init__(self, *, sock, **kwargs):
+        super().__init__(**kwargs)
+        self.sock = sock
+        self.rfile = sock.makefile("rb")
+        self.lock = threading.Lock()
+
+    @classmethod
+    def connect(cls, socket_path, backend, **kwargs):
+        """return a client of the agent at socket_path, or None if none is listening or it is not trusted"""
+        socket_path = Path(socket_path)
+        if not (_owned(socket_path.parent, stat.S_ISDIR, 0o700) and _owned(socket_path, stat.S_ISSOCK)):
+            return None
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(str(socket_path))
+        except OSError:
+            sock.close()
+            return None
+        if _peer_uid(sock) not in (None, getuid()):
+            sock.close()
+            return None
+        client = cls(sock=sock, **kwargs)
+        try:
+            served = client._call("ping").get("store")
+        except (OSError, ValueError, ChamberError):
+            served = None
+        if served != store_fingerprint(backend, client.config):
+            client.__exit__(None, None, None)
+            return None
+        return client
+
+    def __exit__(self, _, ex, tb):
+        self.rfile.close()
+        self.sock.close()
+
+    def _call(self, op, **args):
+        with self.lock:
+            self.sock.sendall(json.dumps(dict(args, op=op)).encode() + b"\n")
+            line = self.rfile.readline()
+        if not line:
+            raise ChamberError("Error: agent closed the connection")
+        response = json.loads(line)
+        if "error" in response:
+            raise ChamberError(response["error"])
+        return response["result"]
+
+    def _keys(self, service):
+        return self._call("keys", service=service)
+
+    def _secrets(self, service):
+        return self._call("secrets", service=service)
+
+    def _read(self, service, key):
+        return tuple(self._call("read", service=service, key=key))
+
+    def _list(self, service):
+        return self._call("list", service=service)
+
+    def _list_services(self, prefix=None):
+        return self._call("list_services", prefix=prefix)
+
+    def _write(self, service, key, value):
+        raise ChamberError("Error: the agent serves read-only requests")
+
+    def _delete(self, service, key):
+        raise ChamberError("Error: the agent serves read-only requests")
+
+
+class Agent:
+    """serve a chamber's read primitives over a Unix domain socket readable only by its owner
+
+    The backend is opened once and kept open, so its connection pool, imports and any loaded
+    data stay warm between requests.  Connections are handled by asyncio; backend calls run one
+    at a time on a worker thread, since backends are not thread-safe.
+    """
+
+    def __init__(self, chamber, socket_path, echo=print):
+        self.chamber = chamber
+        self.socket_path = Path(socket_path)
+        self.echo = echo
+        self.store = store_fingerprint(type(chamber), chamber.config)
+        self.ops = {
+            "ping": lambda: dict(backend=self.chamber.__class__.__name__, pid=getpid(), store=self.store),
+            "keys": lambda service: sorted(self.chamber._keys(service)),
+            "secrets": lambda service: self.chamber._secrets(service),
+            "read": lambda service, key: self.chamber._read(service, key),
+            "list": lambda service: self.chamber._list(service),
+            "list_services": lambda prefix=None: self.chamber._list_services(prefix),
+        }
+        self.loop = None
+        self.stopping = None
+
+    def run(self):
+        import asyncio
+
+        asyncio.run(self._serve())
+
+    def stop(self):
+        """stop serving; may be called from any thread"""
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.stopping.set)
+
+    async def _serve(self):
+        import asyncio
+        import signal
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.loop = asyncio.get_running_loop()
+        self.stopping = asyncio.Event()
+        if threading.current_thread() is threading.main_thread():
+            for signum in [signal.SIGINT, signal.SIGTERM]:
+                self.loop.add_signal_handler(signum, self.stopping.set)
+        self.socket_path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        if not _owned(self.socket_path.parent, stat.S_ISDIR, 0o700):
+            raise ChamberError(f"Error: agent socket directory {self.socket_path.parent} must be owned by you with mode 0700")
+        if self.socket_path.is_socket():
+            self.socket_path.unlink()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="agent")
+        mask = umask(0o177)
+        try:
+            server = await asyncio.start_unix_server(self._handle, path=str(self.socket_path))
+        finally:
+            umask(mask)
+        chmod(self.socket_path, 0o600)
+        self.echo(f"serving {self.chamber.__class__.__name__} on {self.socket_path}")
+        try:
+            with self.chamber:
+                async with server:
+                    await self.stopping.wait()
+        finally:
+            self.executor.shutdown()
+            unlink(self.socket_path)
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                response = await self.loop.run_in_executor(self.executor, self._dispatch, line)
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def _dispatch(self, line):
+        """return the response to one request line"""
+        try:
+            request = json.loads(line)
+            op = self.ops[request.pop("op")]
+            self.chamber.refresh()
+            return {"result": _result(op(**request))}
+        except ChamberError as ex:
+            return {"error": ex.args[0]}
+        except Exception as ex:
+            return {"error": f"{type(ex).__name__}: {ex}"}
@@ -1,72 +1,275 @@
 #!/usr/bin/env python3
 
+import bz2
+import gzip
+import hashlib
+import io
+import json
+import lzma
+import sys
 import tarfile
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from tempfile import TemporaryDirectory
+from uuid import uuid4
+
+from .constants import COMPRESSION_SUFFIXES, DEFAULT_COMPRESSION, DEFAULT_JOBS
+from .exception import ChamberError
+
+# archive members holding backup metadata rather than a service export
+HEADER_MEMBER = "__backup__.json"
+MANIFEST_MEMBER = "__manifest__.json"
+
+# valid --level values for each codec
+LEVELS = {"gz": range(0, 10), "bz2": range(1, 10), "xz": range(0, 10), "none": range(0)}
+
+# compressed stream wrappers for each codec, taking (fileobj, level); level None selects the codec default
+COMPRESSORS = {
+    "gz": lambda fileobj, level: gzip.GzipFile(fileobj=fileobj, mode="wb", compresslevel=9 if level is None else level),
+    "bz2": lambda fileobj, level: bz2.BZ2File(fileobj, "wb", compresslevel=9 if level is None else level),
+    "xz": lambda fileobj, level: lzma.LZMAFile(fileobj, "wb", preset=level),
+}
 
 
 class Restore:
-    def __init__(self, *, chamber, tarball, patch, echo):
+    def __init__(self, *, chamber, tarball, patch, echo, increments=()):
         self.chamber = chamber
         self.tarball = tarball
+        self.increments = list(increments)
         self.patch = patch
         self.echo = echo
 
     def read(self):
-        if not self.patch:
-            self.echo("Deleting...")
-            for service in self.chamber._list_services():
-                self.echo(f"  {service}")
-                for key in self.chamber._secrets(service).keys():
-                    self.echo(f"    {key}")
-                    self.chamber.delete(service, key)
-            self.echo("Deleted.")
+        """import the tarball, then replay each increment on top of it; '-' reads stdin"""
+        service_count = 0
+        backup_id = None
+        for position, tarball in enumerate([self.tarball] + self.increments):
+            if str(tarball) == "-":
+                count, backup_id = self._read(sys.stdin.buffer, "stdin", position, backup_id)
+            else:
+                with Path(tarball).open("rb") as ifp:
+                    count, backup_id = self._read(ifp, str(tarball), position, backup_id)
+            service_count += count
+        source = "stdin" if str(self.tarball) == "-" else str(self.tarball)
+        if self.increments:
+            source += f" and {len(self.increments)} increments"
+        return f"Restored {service_count} services from {source}"
 
-        self.echo("Extracting...")
-        with TemporaryDirectory() as temp_dir:
-            with tarfile.open(self.tarball, "r:gz") as tb:
-                tb.extractall(str(temp_dir))
+    def _read(self, ifp, source, position, previous_id):
+        """import one archive of the chain; return (services written, backup id)"""
+        incremental = position > 0
+        cleared = self.patch or incremental
+        header = None
+        manifest = {}
+        service_count = 0
+        self.echo(f"Importing {source}...")
+        with tarfile.open(fileobj=ifp, mode="r|*") as tb:
+            for member in tb:
+                if not (member.isfile() and member.name.endswith(".json")):
+                    continue
+                data = json.load(tb.extractfile(member))
+                name = Path(member.name).name
+                if name == HEADER_MEMBER:
+                    header = data
+                    self._check_chain(source, header, position, previous_id)
+                elif name == MANIFEST_MEMBER:
+                    manifest = data
+                else:
+                    self._check_chain(source, header, position, previous_id)
+                    if not cleared:
+                        # the archive has yielded a readable service, so it is safe to purge the store
+                        cleared = self._clear()
+                    service = Path(member.name).stem.replace(".", "/")
+                    self._write_service(service, data, replace=incremental)
+                    service_count += 1
+                    self.echo(f"  [{service_count}] {service} ({len(data)} keys)")
+        self._check_chain(source, header, position, previous_id)
+        if not cleared:
+            self._clear()
+        for service in manifest.get("removed", []):
+            self._write_service(service, {}, replace=True)
+            self.echo(f"  [-] {service}")
+        return service_count, header and header["id"]
 
-            restore_dir = Path(temp_dir) / self.tarball.stem
+    def _check_chain(self, source, header, position, previous_id):
+        """raise ChamberError unless the archive applies on top of the previous one in the chain"""
+        base = header and header["base"]
+        if position == 0:
+            if base is not None and not self.patch:
+                raise ChamberError(f"Error: {source} is an incremental backup; restore its base first or use --patch")
+        elif header is None:
+            raise ChamberError(f"Error: {source} is not an incremental backup")
+        elif base != previous_id:
+            raise ChamberError(f"Error: {source} is not an increment of the preceding backup")
 
-            if not restore_dir.is_dir():
-                raise RuntimeError(f"{restore_dir} is not a directory")
+    def _write_service(self, service, secrets, replace):
+        """write secrets to service; with replace, first delete the keys missing from secrets"""
+        if replace:
+            for key in sorted(self.chamber._indexed_keys(service) - set(secrets)):
+                self.chamber.delete(service, key)
+        if secrets:
+            self.chamber.write_service(service, secrets)
 
-            files = [f for f in Path(restore_dir).iterdir() if f.is_file()]
-            service_count = len(files)
+    def _clear(self):
+        self.echo("Deleting...")
+        deleted = self.chamber.clear()
+        self.echo(f"Deleted {deleted} services.")
+        return True
 
-            self.echo("Importing extracted files...")
 
-            for import_file in files:
-                service = import_file.stem.replace(".", "/")
-                self.echo(f"  {service}")
-                with import_file.open("r") as fp:
-                    self.chamber._import(service, fp)
-
-        return f"Restored {service_count} services from {str(self.tarball)}"
+def read_manifest(path):
+    """return the manifest stored in a backup tarball, or read from a manifest JSON file"""
+    with Path(path).open("rb") as ifp:
+        if ifp.read(1) == b"{":
+            ifp.seek(0)
+            return json.load(ifp)
+        ifp.seek(0)
+        with tarfile.open(fileobj=ifp, mode="r|*") as tb:
+            for member in tb:
+                if member.isfile() and Path(member.name).name == MANIFEST_MEMBER:
+                    return json.load(tb.extractfile(member))
+    raise ChamberError(f"Error: no manifest in {path}")
 
 
 class Backup:
-    def __init__(self, *, chamber, output_path, file_name):
+    def __init__(
+        self,
+        *,
+        chamber,
+        output_path,
+        file_name,
+        jobs=DEFAULT_JOBS,
+        base_manifest=None,
+        compression=DEFAULT_COMPRESSION,
+        level=None,
+    ):
+        if compression not in COMPRESSION_SUFFIXES:
+            raise ChamberError(f"Error: unknown compression: '{compression}'")
+        if level is not None and level not in LEVELS[compression]:
+            raise ChamberError(f"Error: invalid level {level} for {compression} compression")
         self.chamber = chamber
+        self.compression = compression
+        self.level = level
+        self.jobs = max(1, int(jobs))
+        self.base = base_manifest
+        self.manifest = None
+        self.service_count = 0
+        self.skipped_count = 0
+        self.fetch_time = 0.0
+        self.elapsed = 0.0
         self.backup_label = datetime.now().strftime("%Y%m%d_%H%M%S") + "_chamber"
-        if file_name:
-            self.tarball_file = Path(output_path) / file_name
+        if str(output_path) == "-":
+            self.tarball_file = None
         else:
-            self.tarball_file = Path(output_path) / (self.backup_label + ".tgz")
-        self.tarball_file = self.tarball_file.resolve()
+            if file_name:
+                self.tarball_file = Path(output_path) / file_name
+            else:
+                self.tarball_file = Path(output_path) / (self.backup_label + COMPRESSION_SUFFIXES[compression])
+            self.tarball_file = self.tarball_file.resolve()
+
+    @property
+    def manifest_file(self):
+        if self.tarball_file is None:
+            return None
+        return self.tarball_file.with_name(self.tarball_file.name.rsplit(".", 1)[0] + ".manifest.json")
 
     def write(self):
-        with TemporaryDirectory() as temp_dir:
-            backup_dir = Path(temp_dir) / self.backup_label
-            backup_dir.mkdir()
-            for service in self.chamber._list_services():
-                service_filename = service.replace("/", ".") + ".json"
-                service_file = Path(backup_dir) / service_filename
-                with service_file.open("w") as ofp:
-                    self.chamber.export(output_file=ofp, fmt="json", compact_json=True, sort_keys=False, service=service)
-
-            with tarfile.open(str(self.tarball_file), "w:gz") as tarball:
-                tarball.add(backup_dir, self.backup_label)
+        """stream each service's JSON export into the tarball as an in-memory member; '-' writes stdout
+
+        With a base manifest only services whose content changed are exported, and the manifest
+        records the services removed since the base.  The manifest is appended to the tarball and,
+        for file output, also written alongside it so the next increment need not reread the tarball.
+        """
+        if self.tarball_file is None:
+            self._write(sys.stdout.buffer)
+            sys.stdout.buffer.flush()
+            return "-"
+        with self.tarball_file.open("wb") as ofp:
+            self._write(ofp)
+        self.manifest_file.write_text(json.dumps(self.manifest, indent=2, sort_keys=True) + "\n")
         return str(self.tarball_file)
+
+    def summary(self):
+        rate = (self.service_count + self.skipped_count) / self.elapsed if self.elapsed else 0.0
+        ret = (
+            f"Exported {self.service_count} services in {self.elapsed:.2f}s "
+            f"({rate:.1f} services/s, {self.fetch_time:.2f}s fetching across {self.jobs} jobs, {self.compression} compression)"
+        )
+        if self.base is not None:
+            removed = len(self.manifest["removed"]) if self.manifest else 0
+            ret += f"; {self.skipped_count} unchanged and {removed} removed since {self.base['label']}"
+        return ret
+
+    def _write(self, ofp):
+        """write the tar stream through the selected compressor"""
+        start = time.perf_counter()
+        if self.compression == "none":
+            self._write_tar(ofp)
+        else:
+            with COMPRESSORS[self.compression](ofp, self.level) as cfp:
+                self._write_tar(cfp)
+        self.elapsed = time.perf_counter() - start
+
+    def _write_tar(self, ofp):
+        mtime = time.time()
+        created = datetime.now().astimezone().isoformat(timespec="seconds")
+        base_id = None if self.base is None else self.base["id"]
+        base_services = {} if self.base is None else self.base["services"]
+        services = {}
+        with tarfile.open(fileobj=ofp, mode="w|") as tarball:
+            tarball.addfile(self._member(self.backup_label, mtime, tarfile.DIRTYPE, 0o700))
+            header = dict(id=uuid4().hex, label=self.backup_label, base=base_id, created=created)
+            self._add_json(tarball, HEADER_MEMBER, header, mtime)
+            for service, data, seconds in self._exports(service for service, _ in self.chamber._walk()):
+                self.fetch_time += seconds
+                digest = "sha256:" + hashlib.sha256(data).hexdigest()
+                previous = base_services.get(service)
+                if previous is not None and previous["hash"] == digest:
+                    services[service] = previous
+                    self.skipped_count += 1
+                    continue
+                services[service] = dict(hash=digest, keys=len(json.loads(data)), updated=created)
+                self._add(tarball, service.replace("/", ".") + ".json", data, mtime)
+                self.service_count += 1
+            removed = sorted(set(base_services) - set(services))
+            self.manifest = dict(header, services=services, removed=removed)
+            self._add_json(tarball, MANIFEST_MEMBER, self.manifest, mtime)
+
+    def _add(self, tarball, name, data, mtime):
+        member = self._member(f"{self.backup_label}/{name}", mtime, tarfile.REGTYPE, 0o600, len(data))
+        tarball.addfile(member, io.BytesIO(data))
+
+    def _add_json(self, tarball, name, data, mtime):
+        self._add(tarball, name, json.dumps(data, sort_keys=True).encode(), mtime)
+
+    def _exports(self, services):
+        """yield _export(service) in service order, running up to jobs exports ahead of the writer"""
+        if self.jobs == 1:
+            for service in services:
+                yield self._export(service)
+            return
+        with ThreadPoolExecutor(max_workers=self.jobs, thread_name_prefix="backup") as pool:
+            pending = deque()
+            for service in services:
+                pending.append(pool.submit(self._export, service))
+                if len(pending) >= 2 * self.jobs:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def _export(self, service):
+        """return (service, compact JSON bytes, seconds spent fetching)"""
+        start = time.perf_counter()
+        buf = io.StringIO()
+        self.chamber.export(output_file=buf, fmt="json", compact_json=True, sort_keys=True, service=service)
+        return service, buf.getvalue().encode(), time.perf_counter() - start
+
+    def _member(self, name, mtime, type, mode, size=0):
+        member = tarfile.TarInfo(name)
+        member.type = type
+        member.mode = mode
+        member.mtime = mtime
+        member.size = size
+        return member
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+import base64
+import hashlib
+import json
+import time
+from os import chmod, environ, fdopen, replace, scandir, unlink
+from pathlib import Path
+from tempfile import mkstemp
+
+from .constants import DEFAULT_CACHE_TTL
+from .exception import ChamberError
+
+ENTRY_SUFFIX = ".entry"
+
+
+def default_cache_dir():
+    return Path(environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "local_chamber" / "vault"
+
+
+class SecretsCache:
+    """encrypted on-disk cache of vault service reads, shared between invocations
+
+    Each service is one file named by a hash of server address, mount and path, holding a Fernet token whose key
+    is derived from the vault token, so entries are unreadable without it and a rotated token
+    simply misses.  An entry younger than ttl is served as is; an older one is revalidated
+    against the KV v2 versions of its leaves before its values are fetched again.
+    """
+
+    def __init__(self, cache_dir, ttl=DEFAULT_CACHE_TTL, token=None, mount="chamber", url=""):
+        self.cache_dir = Path(cache_dir)
+        self.ttl = ttl
+        self.token = token
+        self.mount = mount
+        self.url = url
+        self._fernet = None
+
+    @classmethod
+    def from_config(cls, config, token=None, mount="chamber", url=""):
+        return cls(
+            cache_dir=config.get("vault_cache_dir") or default_cache_dir(),
+            ttl=config.get("vault_cache_ttl", DEFAULT_CACHE_TTL),
+            token=token,
+            mount=mount,
+            url=url,
+        )
+
+    @property
+    def fernet(self):
+        if self._fernet is None:
+            if not self.token:
+                raise ChamberError("Error: the vault cache requires a vault token")
+            try:
+                from cryptography.fernet import Fernet
+            except ImportError as ex:
+                raise ChamberError("Error: the vault cache requires the 'cryptography' package") from ex
+            key = hashlib.sha256(b"local_chamber cache\0" + self.token.encode()).digest()
+            self._fernet = Fernet(base64.urlsafe_b64encode(key))
+        return self._fernet
+
+    def _entry_file(self, service):
+        name = hashlib.sha256(f"{self.url}\0{self.mount}\0{service.strip('/')}".encode()).hexdigest()
+        return self.cache_dir / (name + ENTRY_SUFFIX)
+
+    def get(self, service):
+        """return (entry, fresh) for service, or (None, False) if it is not cached"""
+        fernet = self.fernet
+        from cryptography.fernet import InvalidToken
+
+        try:
+            token = self._entry_file(service).read_bytes()
+            entry = json.loads(fernet.decrypt(token))
+        except (FileNotFoundError, InvalidToken, ValueError):
+            return None, False
+        age = time.time() - fernet.extract_timestamp(token)
+        return entry, 0 <= age < self.ttl
+
+    def put(self, service, entry):
+        """atomically write the entry for service, restarting its ttl"""
+        try:
+            self.cache_dir.mkdir(mode=0o700, parents=True)
+        except FileExistsError:
+            pass
+        else:
+            # mkdir's mode is masked by the umask; an existing directory keeps its own mode
+            chmod(self.cache_dir, 0o700)
+        fd, temp_file = mkstemp(dir=self.cache_dir, prefix=".", suffix=".tmp")
+        try:
+            with fdopen(fd, "wb") as ofp:
+                ofp.write(self.fernet.encrypt(json.dumps(entry).encode()))
+            replace(temp_file, self._entry_file(service))
+        except BaseException:
+            unlink(temp_file)
+            raise
+
+    def discard(self, service):
+        try:
+            self._entry_file(service).unlink()
+        except FileNotFoundError:
+            pass
+
+    def _entries(self):
+        try:
+            with scandir(self.cache_dir) as entries:
+                return [entry for entry in entries if entry.is_file() and entry.name.endswith(ENTRY_SUFFIX)]
+        except FileNotFoundError:
+            return []
+
+    def clear(self):
+        """delete every cached entry; return the number deleted"""
+        entries = self._entries()
+        for entry in entries:
+            unlink(entry.path)
+        return len(entries)
+
+    def stats(self):
+        """return a dict describing the cache directory, using file times so no key is needed"""
+        now = time.time()
+        ages = []
+        size = 0
+        for entry in self._entries():
+            stat = entry.stat()
+            ages.append(now - stat.st_mtime)
+            size += stat.st_size
+        return {
+            "dir": str(self.cache_dir),
+            "entries": len(ages),
+            "fresh": len([age for age in ages if age < self.ttl]),
+            "bytes": size,
+            "ttl": self.ttl,
+            "oldest": round(max(ages), 1) if ages else None,
+            "newest": round(min(ages), 1) if ages else None,
+        }
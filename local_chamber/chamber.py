@@ -1,21 +1,45 @@
 """Main module."""
 
 import json
-import re
+import os
+import pwd
 import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime
-from os import environ, execvpe
+from fcntl import LOCK_EX, flock
+from functools import lru_cache
+from os import chmod, environ, execvpe, fdopen, fsync, getuid, replace, scandir, unlink
 from pathlib import Path
-from subprocess import check_output, run
+from subprocess import run
+from tempfile import mkstemp
 
-import hvac
-import yaml
+from click.exceptions import Exit
 
 from .exception import ChamberError
-from .vault import VaultSecrets
 
 EXEC_WAIT = True
 
+# FileChamber rewrites the secrets file once its change journal holds this many entries
+JOURNAL_COMPACT_ENTRIES = 1000
+
+# most services whose secrets are memoized by a Chamber within one invocation
+SECRETS_CACHE_SIZE = 256
+
+# seconds a SqliteChamber waits for another process's write transaction
+SQLITE_BUSY_TIMEOUT = 30
+
+
+@lru_cache(maxsize=None)
+def _owner_name(uid):
+    """return the user name for uid, or the numeric uid if it has no passwd entry"""
+    try:
+        return pwd.getpwuid(uid).pw_name
+    except KeyError:
+        return str(uid)
+
 
 class Chamber:
     def __init__(self, *, config, debug, echo, require_exists):
@@ -27,13 +51,35 @@ class Chamber:
         self.require_key = require_exists
         self.force_lower_services = False
         self.force_lower_keys = False
+        self._index = {}
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.timings = config.get("timings")
 
     def __enter__(self):
+        self._index = {}
+        self._cache = OrderedDict()
         return self
 
     def __exit__(self, _, ex, tb):
         pass
 
+    @classmethod
+    def store_identity(cls, config):
+        """return the config values that select the store this backend opens, as strings"""
+        return [str(Path(config["dir"]).resolve())]
+
+    def refresh(self):
+        """drop state memoized for one invocation, so a long-lived chamber sees changes made elsewhere"""
+        self._index = {}
+        with self._cache_lock:
+            self._cache.clear()
+
+    def _count(self, name, n=1):
+        """add n to a --timings counter"""
+        if self.timings is not None:
+            self.timings.count(name, n)
+
     def _secret_not_found(self, service, key):
         return f"Error: secret not found: '{service}/{key}'"
 
@@ -58,15 +104,50 @@ class Chamber:
         service, key = self._verify_key(service, key)
         if service and key:
             self._delete(service, key)
+            self._invalidate(service)
         return 0
 
+    def _indexed_keys(self, service):
+        """return the set of key names in service, looking up each service at most once per invocation"""
+        if service not in self._index:
+            self._index[service] = frozenset(self._keys(service))
+        return self._index[service]
+
+    def _cached_secrets(self, service):
+        """return a copy of the secrets of service, reading each service at most once per invocation"""
+        with self._cache_lock:
+            secrets = self._cache.get(service)
+            if secrets is not None:
+                self._cache.move_to_end(service)
+                return dict(secrets)
+        secrets = self._secrets(service)
+        with self._cache_lock:
+            self._cache[service] = secrets
+            while len(self._cache) > SECRETS_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return dict(secrets)
+
+    def _invalidate(self, service):
+        """drop index and cache entries for service and all of its subservices"""
+        prefix = service + "/"
+        for _service in [s for s in self._index if s == service or s.startswith(prefix)]:
+            del self._index[_service]
+        with self._cache_lock:
+            for _service in [s for s in self._cache if s == service or s.startswith(prefix)]:
+                del self._cache[_service]
+
     def _is_service(self, service):
         """return True if service exists, else False"""
-        return service in self._list_services()
+        return bool(self._indexed_keys(service))
 
     def _is_secret(self, service, key):
         """return True if service exists and contains key, else False"""
-        return self._is_service(service) and (key in self._secrets(service))
+        return key in self._indexed_keys(service)
+
+    def _walk(self, prefix=None):
+        """yield (service, keys) for every service in the store, or in the subtree rooted at prefix"""
+        for service in self._list_services(prefix):
+            yield service, self._indexed_keys(service)
 
     def _verify_service(self, service, condition=None):
         """raise an error if require_service and condition is false"""
@@ -108,15 +189,12 @@ class Chamber:
         """Prune a service, including all subkeys"""
         service = self._verify_service(service)
         if service:
-            path = service.split("/")
-            plen = len(path)
-            for _service in self._list_services():
-                _path = _service.split("/")
-                if path[:plen] == _path[:plen]:
-                    for _key in self._secrets(_service).keys():
-                        self._delete(_service, _key)
-                    if self._secrets(_service) == {}:
-                        self._delete(_service, None)
+            for _service, _keys in list(self._walk(service)):
+                for _key in _keys:
+                    self._delete(_service, _key)
+                if not self._keys(_service):
+                    self._delete(_service, None)
+            self._invalidate(service)
 
         return 0
 
@@ -124,7 +202,7 @@ class Chamber:
         """Print the secrets from the secrets directory in a format to export as environment variables"""  # noqa
         service = self._verify_service(service)
         if service:
-            secrets = self._secrets(service)
+            secrets = self._cached_secrets(service)
             self.echo("\n".join(sorted([self._export(k, v) for k, v in secrets.items()])))
         return 0
 
@@ -146,7 +224,7 @@ class Chamber:
         for service in services:
             service = self._verify_service(service)
             if service:
-                secrets = self._secrets(service)
+                secrets = self._cached_secrets(service)
                 for k, v in secrets.items():
                     env[k.upper()] = str(v)
 
@@ -176,13 +254,15 @@ class Chamber:
         elif tree:
             secrets = self._tree(service)
         else:
-            secrets = self._secrets(service)
+            secrets = self._cached_secrets(service)
         if fmt == "json":
             if compact_json:
                 out = json.dumps(secrets, separators=[",", ":"], sort_keys=sort_keys) + "\n"
             else:
                 out = json.dumps(secrets, indent=2, sort_keys=sort_keys) + "\n"
         elif fmt == "yaml":
+            import yaml
+
             sorted_secrets = {k: v for k, v in self.sorted_items(secrets)}
             out = yaml.dump(sorted_secrets)
         elif fmt == "csv":
@@ -201,40 +281,46 @@ class Chamber:
 
     def _tree(self, service):
         secrets = {}
-        for _service in self._list_services():
-            if _service.startswith(service):
-                if self._secrets(_service):
-                    s = secrets
-                    subservice = _service[len(service) + 1 :]
-                    if subservice != "":
-                        for level in subservice.split("/"):
-                            s = s.setdefault(level, {})
-                    s.update(self._secrets(_service))
+        for _service, _ in self._walk(service):
+            s = secrets
+            subservice = _service[len(service) + 1 :]
+            if subservice != "":
+                for level in subservice.split("/"):
+                    s = s.setdefault(level, {})
+            s.update(self._cached_secrets(_service))
         return secrets
 
-    def find(self, key, by_value, regex=False):
-        """Find the given secret across all services"""
+    def find(self, key, by_value, regex=False, jobs=1, glob=False):
+        """Find the given secret across all services
+
+        key is a pattern or a list of patterns; see search.Matcher.  Services are reported in
+        sorted order.  Key names are matched from the keys-only listing; with by_value, services
+        are read up to jobs at a time and each match is printed as soon as its service has been
+        scanned.
+        """
+        from .search import Matcher, ordered_map
+
+        matcher = Matcher([key] if isinstance(key, str) else key, regex, glob)
         if by_value or regex:
             self.echo("Service\tKey")
         else:
             self.echo("Service")
 
-        if not regex:
-            key = "^" + key + "$"
-
-        services = self._list_services()
-
-        for service in sorted(services):
-            for secret_key, secret_value in self._secrets(service).items():
-                if by_value:
-                    if re.match(key, secret_value.strip()):
+        walk = sorted(self._walk(), key=lambda item: item[0])
+        if by_value:
+            services = (service for service, _ in walk)
+            for service, secrets in ordered_map(self._secrets, services, jobs):
+                for secret_key in sorted(secrets):
+                    if matcher(secrets[secret_key].strip()):
                         self.echo(service + "\t" + secret_key)
-                else:
-                    if re.match(key, secret_key):
-                        if regex:
-                            self.echo(service + "\t" + secret_key)
-                        else:
-                            self.echo(service)
+        else:
+            for service, keys in walk:
+                matches = [secret_key for secret_key in sorted(keys) if matcher(secret_key)]
+                if regex:
+                    for secret_key in matches:
+                        self.echo(service + "\t" + secret_key)
+                elif matches:
+                    self.echo(service)
         return 0
 
     def _import(self, service, input_file):
@@ -262,19 +348,17 @@ class Chamber:
         return 0
 
     def list_services(self, *, service_filter=None, include_secrets=False):
-        """List services"""
+        """List services, or only service_filter and its subservices"""
         self.echo("Service")
         output = []
         if self.force_lower_services and service_filter is not None:
             service_filter = service_filter.lower()
-        services = self._list_services()
-        for service in services:
-            if service_filter is None or service.startswith(service_filter):
-                if include_secrets:
-                    for secret in sorted(self._secrets(service)):
-                        output.append(f"{service}/{secret}")
-                else:
-                    output.append(service)
+        for service, keys in self._walk(service_filter):
+            if include_secrets:
+                for secret in sorted(keys):
+                    output.append(f"{service}/{secret}")
+            else:
+                output.append(service)
         for line in sorted(output):
             self.echo(line)
         return 0
@@ -283,8 +367,9 @@ class Chamber:
         """Read a specific secret from the parameter store"""
         service, key = self._verify_key(service, key)
         if key:
-            value, mtime, owner = self._read(service, key)
-            out = f"{key}\t{value}\t1\t{mtime}\t{owner}"
+            # backends that keep versions return one after the owner
+            value, mtime, owner, *version = self._read(service, key)
+            out = f"{key}\t{value}\t{version[0] if version else 1}\t{mtime}\t{owner}"
             if quiet:
                 self.echo(value)
             else:
@@ -293,6 +378,10 @@ class Chamber:
 
         return 0
 
+    def migrate(self, service, layout):
+        """convert stored secrets to another storage layout in place"""
+        raise ChamberError(f"Error: migrate is not supported by {self.__class__.__name__}")
+
     def write(self, service, key, value):
         """write a secret"""
         if self.force_lower_services:
@@ -302,66 +391,183 @@ class Chamber:
         if value == "-":
             value = sys.stdin.read()
         self._write(service, key, value)
+        self._invalidate(service)
         return 0
 
+    def write_service(self, service, secrets):
+        """write all secrets of a service as one batch"""
+        if self.force_lower_services:
+            service = service.lower()
+        if self.force_lower_keys:
+            secrets = {k.lower(): v for k, v in secrets.items()}
+        self._write_service(service, secrets)
+        self._invalidate(service)
+        return 0
+
+    def clear(self):
+        """delete every secret in the store; return the number of services deleted"""
+        count = self._clear()
+        self._index = {}
+        with self._cache_lock:
+            self._cache.clear()
+        return count
+
+    def _write_service(self, service, secrets):
+        for key, value in secrets.items():
+            self._write(service, key, value)
+
+    def _clear(self):
+        services = list(self._walk())
+        for service, keys in services:
+            for key in keys:
+                self._delete(service, key)
+        return len(services)
+
 
 class VaultChamber(Chamber):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
+        self.cache = None
+        # {service: KV names listed under it}, kept alongside _index for one invocation
+        self._leaf_index = {}
+
+    @classmethod
+    def store_identity(cls, config):
+        """the server, mount and layout, and the token resolved as hvac would, without importing hvac"""
+        token = config.get("token") or environ.get("VAULT_TOKEN")
+        if not token:
+            token_file = Path("~/.vault-token").expanduser()
+            token = token_file.read_text().strip() if token_file.is_file() else ""
+        return [environ.get("VAULT_ADDR", ""), config.get("root") or "chamber", config.get("vault_layout") or "key", token]
 
     def __enter__(self):
-        self.secrets = VaultSecrets()
-        return self
+        from .vault import VaultSecrets
+
+        self.secrets = VaultSecrets.from_config(self.config)
+        self.cache = None
+        if self.config.get("vault_cache"):
+            from .cache import SecretsCache
+
+            self.cache = SecretsCache.from_config(
+                self.config, token=self.secrets.client.token, mount=self.secrets.base, url=self.secrets.client.url
+            )
+        self._leaf_index = {}
+        return super().__enter__()
 
     def __exit__(self, _, ex, tb):
-        pass
+        self.secrets.close()
+
+    def _cache_entry(self, service):
+        """return the cached read of service, revalidating a stale entry by leaf versions before refetching"""
+        entry, fresh = self.cache.get(service)
+        if fresh:
+            return entry
+        if entry is not None and self.secrets.leaf_versions(service) == entry["versions"]:
+            self.cache.put(service, entry)
+            return entry
+        secrets, versions, metadata = self.secrets.get_service_versions(service)
+        entry = dict(secrets=secrets, versions=versions, metadata=metadata)
+        self.cache.put(service, entry)
+        return entry
+
+    def refresh(self):
+        super().refresh()
+        self._leaf_index = {}
+
+    def _uncache(self, service):
+        self._leaf_index.pop(service, None)
+        if self.cache is not None:
+            self.cache.discard(service)
 
     def _list(self, service):
         ret = {}
-        for key in self.secrets.keys(service):
-            version, mtime, owner = self._metadata(service, key)
-            ret[key] = (version, mtime, owner)
+        for key, metadata in self.secrets.list_metadata(service).items():
+            ret[key] = (metadata["current_version"], self._mtime(metadata["updated_time"]), "undefined")
         return ret
 
-    def _list_services(self):
-        """return a list of available services"""
-        services = self.secrets.services("/")
+    def _list_services(self, prefix=None):
+        """return a list of available services, listing only the subtree under prefix"""
+        services = self.secrets.services(prefix or "/")
         return services
 
+    def _walk(self, prefix=None):
+        """yield (service, keys) from the leaves of one tree listing, reading service documents concurrently"""
+        tree = self.secrets.tree(prefix or "/")
+        self._leaf_index.update(tree)
+        keys = self.secrets.map(lambda service: self.secrets.keys_from_leaves(service, tree[service]), tree)
+        for service, _keys in zip(tree, keys):
+            self._index[service] = frozenset(_keys)
+            yield service, self._index[service]
+
+    def _keys(self, service):
+        """return the key names in a service, from a fresh cache entry when there is one"""
+        if self.cache is not None:
+            entry, fresh = self.cache.get(service)
+            if fresh:
+                self._leaf_index[service] = list(entry["versions"])
+                return list(entry["secrets"])
+        leaves = self.secrets.leaves(service)
+        self._leaf_index[service] = leaves
+        return self.secrets.keys_from_leaves(service, leaves)
+
     def _secrets(self, service):
-        keys = self.secrets.keys(service)
-        return {k: self.secrets.get(service, k) for k in keys}
+        if self.cache is not None:
+            return dict(self._cache_entry(service)["secrets"])
+        return self.secrets.get_service(service)
 
     def _write(self, service, key, value):
         """write a secret"""
         self.secrets.set(service, key, value)
+        self._uncache(service)
 
-    def _metadata(self, service, key):
+    def _write_service(self, service, secrets):
+        self.secrets.set_service(service, secrets)
+        self._uncache(service)
+
+    def _clear(self):
+        count = self.secrets.delete_tree("/")
+        self._leaf_index = {}
+        if self.cache is not None:
+            self.cache.clear()
+        return count
+
+    def _mtime(self, timestamp):
+        return datetime.fromisoformat(timestamp.split(".")[0].rstrip("Z"))
+
+    def _read(self, service, key):
+        """return a secret (value, mtime, owner) from a single read of the secret version, or from the cache"""
+        from hvac.exceptions import InvalidPath
+
+        if self.cache is not None:
+            entry = self._cache_entry(service)
+            if key in entry["secrets"]:
+                return (entry["secrets"][key], self._mtime(entry["metadata"][key][1]), "undefined")
         try:
-            metadata = self.secrets.get_metadata(service, key)
-        except hvac.exceptions.InvalidPath as ex:
+            value, metadata = self.secrets.get_with_metadata(service, key)
+        except InvalidPath as ex:
             if self.require_key:
                 raise ChamberError(self._secret_not_found(service, key)) from ex
             else:
                 return (None, None, None)
-        timestamp = metadata["created_time"].split(".")[0]
-        mtime = datetime.fromisoformat(timestamp)
-        owner = "undefined"
-        version = metadata["version"]
-        return (version, mtime, owner)
-
-    def _read(self, service, key):
-        """return a secret (value, mtime, owner)"""
-        _, mtime, owner = self._metadata(service, key)
-        value = self.secrets.get(service, key)
-        return (value, mtime, owner)
+        return (value, self._mtime(metadata["created_time"]), "undefined")
 
     def _delete(self, service, key):
         """delete a secret"""
         if key is None:
             return
-        _, _, _ = self._read(service, key)
-        return self.secrets.delete(f"{service}/{key}")
+        leaves = self.secrets.delete_key(service, key, self._leaf_index.get(service))
+        self._uncache(service)
+        if leaves is not None:
+            self._leaf_index[service] = leaves
+
+    def migrate(self, service, layout):
+        """convert stored secrets to another storage layout in place"""
+        for _service in self.secrets.migrate(service or "/", layout):
+            self._uncache(_service)
+            self.echo(_service)
+        self._index = {}
+        self._leaf_index = {}
+        return 0
 
 
 class EnvdirChamber(Chamber):
@@ -380,43 +586,72 @@ class EnvdirChamber(Chamber):
             ret = ret.lower()
         return ret
 
-    def _listdirs(self, dirs, curdir):
-        if dirs is None:
-            dirs = set([])
-        for s in curdir.iterdir():
-            if s.is_dir():
-                dirs = self._listdirs(dirs, s)
-            elif s.is_file():
-                if not s.name.startswith(".") and not s.name.lower().startswith("readme."):
-                    dirs.add(curdir)
-        return dirs
+    def _is_secret_file(self, name):
+        return not name.startswith(".") and not name.lower().startswith("readme.")
+
+    def _scandir(self, path):
+        """return (subdirectory paths, secret file names) of path using cached DirEntry types"""
+        dirs = []
+        files = []
+        self._count("dirs_scanned")
+        try:
+            with scandir(path) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        dirs.append(entry.path)
+                    elif entry.is_file():
+                        files.append(entry.name)
+        except (FileNotFoundError, NotADirectoryError):
+            pass
+        if not any(self._is_secret_file(name) for name in files):
+            files = []
+        return dirs, files
+
+    def _walk(self, prefix=None):
+        """yield (service, keys) for every service in a single traversal of secrets_dir or its prefix subdirectory"""
+        pending = [str(self.secrets_dir if prefix is None else self._secrets_dir(prefix))]
+        while pending:
+            path = pending.pop()
+            dirs, files = self._scandir(path)
+            pending.extend(sorted(dirs, reverse=True))
+            if files:
+                service = self._service_name(Path(path))
+                self._index[service] = frozenset(files)
+                yield service, files
 
     def _stats(self, secret):
+        self._count("files_stated")
         stat = secret.stat()
         mtime = datetime.fromtimestamp(stat.st_mtime).strftime("%Y-%m-%d %H:%M:%S")
-        owner = check_output(f"id -un {stat.st_uid}", shell=True).decode().strip()
+        owner = _owner_name(stat.st_uid)
         return mtime, owner
 
     def _secrets(self, service, require_exists=True):
         """return dict of secrets in a service"""
         secrets = self._secrets_dir(service)
-        if secrets.is_dir():
-            ret = {s.name: s.read_text().strip() for s in secrets.iterdir() if s.is_file()}
-        else:
-            ret = {}
-        return ret
+        _, files = self._scandir(secrets)
+        values = {name: (secrets / name).read_text() for name in files}
+        self._count("bytes_read", sum(len(value) for value in values.values()))
+        return {name: value.strip() for name, value in values.items()}
 
     def _list(self, service):
         """return a list of secrets in a service"""
         secrets = {}
-        for secret in [s for s in self._secrets_dir(service).iterdir() if s.is_file()]:
-            mtime, owner = self._stats(secret)
-            secrets[secret.name] = (1, mtime, owner)
+        with scandir(self._secrets_dir(service)) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    mtime, owner = self._stats(entry)
+                    secrets[entry.name] = (1, mtime, owner)
         return secrets
 
-    def _list_services(self):
+    def _list_services(self, prefix=None):
         """return a list of available services"""
-        return [self._service_name(s) for s in self._listdirs(None, self.secrets_dir)]
+        return [service for service, _ in self._walk(prefix)]
+
+    def _keys(self, service):
+        """return the key names in a service"""
+        _, files = self._scandir(self._secrets_dir(service))
+        return files
 
     def _write(self, service, key, value):
         """write a secret"""
@@ -424,11 +659,25 @@ class EnvdirChamber(Chamber):
         secret.parent.mkdir(parents=True, exist_ok=True)
         secret.write_text(value)
 
+    def _clear(self):
+        """remove every secret file, then each emptied service directory, deepest first"""
+        services = list(self._walk())
+        for service, keys in services:
+            for key in keys:
+                (self._secrets_dir(service) / key).unlink()
+        for service, _ in sorted(services, key=lambda item: item[0].count("/"), reverse=True):
+            service_dir = self._secrets_dir(service)
+            if service_dir != self.secrets_dir and not any(service_dir.iterdir()):
+                service_dir.rmdir()
+        return len(services)
+
     def _read(self, service, key):
         """return a secret (value, mtime, owner)"""
         secret = self._secrets_dir(service) / key
         try:
-            value = secret.read_text().strip()
+            value = secret.read_text()
+            self._count("bytes_read", len(value))
+            value = value.strip()
             mtime, owner = self._stats(secret)
         except FileNotFoundError as ex:
             raise ChamberError(self._secret_not_found(service, key)) from ex
@@ -450,22 +699,181 @@ class EnvdirChamber(Chamber):
 class FileChamber(Chamber):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.secrets_file = self.config["file"]
+        # resolved, so a symlinked secrets file is replaced at its target and keeps one journal and index
+        self.secrets_file = Path(self.config["file"]).resolve()
+        self.journal = self.config.get("file_journal", False)
+        self.journal_file = Path(str(self.secrets_file) + ".journal").resolve()
+        self.lock_file = Path(str(self.secrets_file) + ".lock")
+        self.use_index = self.config.get("file_index", False)
+        self.index = None
+        self.data = None
         self.dirty = False
+        self.rewrite = False
+        self.changes = []
+        self.file_state = None
+
+    @classmethod
+    def store_identity(cls, config):
+        return [str(Path(config["file"]).resolve())]
 
     def __enter__(self):
-        with Path(self.secrets_file).open("r") as ifp:
-            self.secrets = json.load(ifp)
+        self.file_state = self._file_state()
+        self.data = None
+        self.index = None
         self.dirty = False
-        return self
+        self.rewrite = False
+        self.changes = []
+        if self.use_index and not self.journal_file.exists():
+            from .fileindex import FileIndex
+
+            self.index = FileIndex(self.secrets_file)
+            self.index.open()
+        return super().__enter__()
 
     def __exit__(self, _, ex, tb):
+        if self.index is not None:
+            self.index.close()
+            self.index = None
         if self.dirty:
-            with Path(self.secrets_file).open("w") as ifp:
-                json.dump(self.secrets, ifp)
+            with self._locked():
+                if self.journal and not self.rewrite and self._journal_entries() + len(self.changes) < JOURNAL_COMPACT_ENTRIES:
+                    self._append_journal(self.changes)
+                else:
+                    self._save()
         self.dirty = False
+        self.rewrite = False
+        self.changes = []
+
+    @contextmanager
+    def _locked(self):
+        """hold the store's exclusive lock, so journal appends and rewrites by other writers wait"""
+        fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            flock(fd, LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    def _file_state(self):
+        """return identifying stat fields of the secrets file and journal"""
+        state = []
+        for path in [Path(self.secrets_file), self.journal_file]:
+            self._count("files_stated")
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                state.append(None)
+            else:
+                state.append((stat.st_ino, stat.st_size, stat.st_mtime_ns))
+        return state
+
+    def refresh(self):
+        """reload the secrets file if it or its journal changed since it was loaded"""
+        super().refresh()
+        if not self.dirty and self._file_state() != self.file_state:
+            self.__exit__(None, None, None)
+            self.__enter__()
+
+    @property
+    def secrets(self):
+        """the full secrets tree, parsed on first use"""
+        if self.data is None:
+            self._load()
+        return self.data
+
+    def _load(self):
+        """parse the secrets file, then apply the journal and this invocation's pending changes"""
+        self.file_state = self._file_state()
+        with Path(self.secrets_file).open("r") as ifp:
+            text = ifp.read()
+        self._count("bytes_read", len(text))
+        self.data = json.loads(text)
+        self._replay_journal()
+        for change in self.changes:
+            self._apply(change)
+
+    def _indexed(self):
+        """return the sidecar index if it still describes the data, else None"""
+        if self.data is None and not self.changes:
+            return self.index
+        return None
+
+    def _save(self):
+        """atomically replace the secrets file with the current data, then drop the journal; call with the lock held"""
+        if self.data is None or self._file_state() != self.file_state:
+            # rebuild from the files as they are now, keeping changes other writers made since the load
+            self.data = None
+            self._load()
+        secrets_file = Path(self.secrets_file)
+        fd, temp_file = mkstemp(dir=secrets_file.parent, prefix=f".{secrets_file.name}.", suffix=".tmp")
+        try:
+            with fdopen(fd, "w") as ofp:
+                json.dump(self.secrets, ofp)
+                ofp.flush()
+                fsync(ofp.fileno())
+            chmod(temp_file, secrets_file.stat().st_mode & 0o7777)
+            replace(temp_file, secrets_file)
+        except BaseException:
+            unlink(temp_file)
+            raise
+        if self.journal_file.exists():
+            self.journal_file.unlink()
+
+    def _append_journal(self, changes):
+        """append changes as JSON lines, starting a new line if a previous append was torn"""
+        lines = "".join(json.dumps(change, separators=(",", ":")) + "\n" for change in changes)
+        with self.journal_file.open("a+b") as ofp:
+            if ofp.seek(0, 2) > 0:
+                ofp.seek(-1, 2)
+                if ofp.read(1) != b"\n":
+                    lines = "\n" + lines
+            ofp.write(lines.encode())
+            ofp.flush()
+            fsync(ofp.fileno())
+
+    def _journal_entries(self):
+        """return the number of lines in the journal, without parsing them"""
+        try:
+            with self.journal_file.open("rb") as ifp:
+                return sum(chunk.count(b"\n") for chunk in iter(lambda: ifp.read(1 << 16), b""))
+        except FileNotFoundError:
+            return 0
+
+    def _replay_journal(self):
+        """apply journaled changes to the loaded data"""
+        if not self.journal_file.exists():
+            return
+        with self.journal_file.open("r") as ifp:
+            for line in ifp:
+                try:
+                    change = json.loads(line)
+                except json.JSONDecodeError:
+                    # a torn append from an interrupted writer
+                    continue
+                self._apply(change)
+
+    def _apply(self, change):
+        """apply one journaled or pending change to the loaded data"""
+        if change["op"] == "write":
+            self._set(change["service"], change["key"], change["value"])
+        elif change["op"] == "clear":
+            self.data = {}
+        else:
+            try:
+                self._remove(change["service"], change["key"])
+            except ChamberError:
+                pass
+
+    def _log(self, op, service, key, value=None):
+        change = {"op": op, "service": service, "key": key}
+        if op == "write":
+            change["value"] = value
+        self.changes.append(change)
+        self.dirty = True
 
     def _secrets(self, service):
+        if self._indexed():
+            return self.index.secrets(service)
         s = self.secrets
         for level in service.split("/"):
             try:
@@ -476,11 +884,11 @@ class FileChamber(Chamber):
         return ret
 
     def _list(self, service):
+        self._count("files_stated")
         stat = Path(self.secrets_file).stat()
         mtime = datetime.fromtimestamp(stat.st_mtime).strftime("%Y-%m-%d %H:%M:%S")
-        owner = check_output(f"id -un {stat.st_uid}", shell=True).decode().strip()
-        mtime = datetime.fromtimestamp(stat.st_mtime).strftime("%Y-%m-%d %H:%M:%S")
-        return {s: (1, mtime, owner) for s in self._secrets(service)}
+        owner = _owner_name(stat.st_uid)
+        return {s: (1, mtime, owner) for s in self._keys(service)}
 
     def _slist(self, secrets, path=[]):
         services = []
@@ -490,31 +898,61 @@ class FileChamber(Chamber):
                     services.append("/".join(path + [k]))
                 ret = self._slist(v, path + [k])
                 services.extend(ret)
-        return list(set(services))
+        return sorted(set(services))
 
     def _list_services(self, prefix=None):
-        """return a list of available services"""
-        return self._slist(self.secrets, [])
+        """return a list of available services, descending only into the prefix sub-dict"""
+        if self._indexed():
+            return self.index.services(prefix)
+        if prefix is None:
+            return self._slist(self.secrets, [])
+        path = prefix.split("/")
+        s = self.secrets
+        for level in path:
+            s = s.get(level) if isinstance(s, dict) else None
+        if not isinstance(s, dict):
+            return []
+        services = self._slist(s, path)
+        if any(not isinstance(v, dict) for v in s.values()):
+            services.insert(0, prefix)
+        return services
 
-    def _write(self, service, key, value):
-        """write a secret"""
+    def _keys(self, service):
+        """return the key names in a service"""
+        if self._indexed():
+            return self.index.keys(service)
+        s = self.secrets
+        for level in service.split("/"):
+            s = s.get(level) if isinstance(s, dict) else None
+        if not isinstance(s, dict):
+            return []
+        return [k for k, v in s.items() if not isinstance(v, dict)]
+
+    def _set(self, service, key, value):
         s = self.secrets
         for level in service.split("/"):
             s = s.setdefault(level, {})
         s[key] = value
-        self.dirty = True
+
+    def _write(self, service, key, value):
+        """write a secret; until the tree is loaded, the change is only logged"""
+        if self.data is not None:
+            self._set(service, key, value)
+        self._log("write", service, key, value)
 
     def _read(self, service, key):
         """return a secret"""
+        if self._indexed():
+            return self.index.get(service, key), None, None
         s = self.secrets
         for level in service.split("/"):
             s = s.get(level, {})
         return s.get(key, None), None, None
 
-    def _delete(self, service, key):
-        """delete key from service"""
-        if service not in self._list_services():
-            return
+    def _remove(self, service, key):
+        """remove key (or the whole service if key is None); return True if anything changed"""
+        if not self._keys(service):
+            return False
         s = self.secrets
         for level in service.split("/"):
             parent = s
@@ -523,9 +961,166 @@ class FileChamber(Chamber):
         if key is not None:
             try:
                 del s[key]
-                self.dirty = True
             except KeyError as ex:
                 raise ChamberError(self._secret_not_found(service, key)) from ex
         if key is None or parent[leaf] == {}:
             parent.pop(leaf)
-            self.dirty = True
+        return True
+
+    def _delete(self, service, key):
+        """delete key from service; until the tree is loaded, the change is only logged"""
+        if self.data is None:
+            self._log("delete", service, key)
+        elif self._remove(service, key):
+            self._log("delete", service, key)
+
+    def _clear(self):
+        """drop the whole tree; the secrets file is rewritten once on exit"""
+        count = len(self._list_services())
+        self.data = {}
+        self.changes = [{"op": "clear"}]
+        self.dirty = True
+        self.rewrite = True
+        return count
+
+
+class SqliteChamber(Chamber):
+    """secrets in a SQLite database, one row per key"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS secrets (
+            service TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value TEXT NOT NULL,
+            version INTEGER NOT NULL DEFAULT 1,
+            mtime REAL NOT NULL,
+            owner TEXT NOT NULL,
+            PRIMARY KEY (service, key)
+        ) WITHOUT ROWID
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.db_file = Path(self.config.get("sqlite") or ".secrets.db")
+        self.db = None
+        self.writing = False
+
+    @classmethod
+    def store_identity(cls, config):
+        return [str(Path(config.get("sqlite") or ".secrets.db").resolve())]
+
+    def __enter__(self):
+        import sqlite3
+
+        self.db = sqlite3.connect(str(self.db_file), timeout=SQLITE_BUSY_TIMEOUT, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(self.SCHEMA)
+        self.writing = False
+        self.lock = threading.Lock()
+        return super().__enter__()
+
+    def __exit__(self, _, ex, tb):
+        if self.writing:
+            self.db.execute("COMMIT" if self._succeeded(ex) else "ROLLBACK")
+            self.writing = False
+        self.db.close()
+        self.db = None
+
+    @staticmethod
+    def _succeeded(ex):
+        """return True if the invocation ended without error: no exception, or a zero exit status"""
+        if ex is None:
+            return True
+        if isinstance(ex, Exit):
+            return ex.exit_code == 0
+        if isinstance(ex, SystemExit):
+            return ex.code in (None, 0)
+        return False
+
+    def _query(self, sql, *args):
+        with self.lock:
+            return self.db.execute(sql, args).fetchall()
+
+    def _begin(self):
+        """start the invocation's write transaction, waiting for any other writer to finish"""
+        if not self.writing:
+            self.db.execute("BEGIN IMMEDIATE")
+            self.writing = True
+
+    def _subtree(self, prefix):
+        """return the SQL condition and arguments selecting prefix and its subservices"""
+        if prefix is None:
+            return "1", ()
+        return "(service = ? OR (service > ? AND service < ?))", (prefix, prefix + "/", prefix + "0")
+
+    def _keys(self, service):
+        return [key for key, in self._query("SELECT key FROM secrets WHERE service = ? ORDER BY key", service)]
+
+    def _secrets(self, service):
+        return dict(self._query("SELECT key, value FROM secrets WHERE service = ?", service))
+
+    def _read(self, service, key):
+        """return a secret (value, mtime, owner, version)"""
+        rows = self._query("SELECT value, mtime, owner, version FROM secrets WHERE service = ? AND key = ?", service, key)
+        if not rows:
+            raise ChamberError(self._secret_not_found(service, key))
+        value, mtime, owner, version = rows[0]
+        return value, self._mtime(mtime), owner, version
+
+    def _mtime(self, mtime):
+        return datetime.fromtimestamp(mtime).strftime("%Y-%m-%d %H:%M:%S")
+
+    def _list(self, service):
+        rows = self._query("SELECT key, version, mtime, owner FROM secrets WHERE service = ?", service)
+        return {key: (version, self._mtime(mtime), owner) for key, version, mtime, owner in rows}
+
+    def _walk(self, prefix=None):
+        """yield (service, keys) for every service, or the subtree rooted at prefix, from one index scan"""
+        condition, args = self._subtree(prefix)
+        rows = self._query(f"SELECT service, key FROM secrets WHERE {condition} ORDER BY service, key", *args)
+        service = None
+        keys = []
+        for _service, key in rows + [(None, None)]:
+            if _service != service:
+                if service is not None:
+                    self._index[service] = frozenset(keys)
+                    yield service, keys
+                service = _service
+                keys = []
+            keys.append(key)
+
+    def _list_services(self, prefix=None):
+        condition, args = self._subtree(prefix)
+        return [service for service, in self._query(f"SELECT DISTINCT service FROM secrets WHERE {condition} ORDER BY service", *args)]
+
+    def _write(self, service, key, value):
+        self._write_service(service, {key: value})
+
+    def _write_service(self, service, secrets):
+        self._begin()
+        mtime = time.time()
+        owner = _owner_name(getuid())
+        with self.lock:
+            self.db.executemany(
+                "INSERT INTO secrets (service, key, value, mtime, owner) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (service, key) DO UPDATE SET "
+                "value = excluded.value, version = version + 1, mtime = excluded.mtime, owner = excluded.owner",
+                [(service, key, str(value), mtime, owner) for key, value in secrets.items()],
+            )
+
+    def _delete(self, service, key):
+        """delete key from service, or every key of service if key is None"""
+        self._begin()
+        with self.lock:
+            if key is None:
+                self.db.execute("DELETE FROM secrets WHERE service = ?", (service,))
+            elif self.db.execute("DELETE FROM secrets WHERE service = ? AND key = ?", (service, key)).rowcount == 0:
+                raise ChamberError(self._secret_not_found(service, key))
+
+    def _clear(self):
+        self._begin()
+        with self.lock:
+            count = self.db.execute("SELECT COUNT(DISTINCT service) FROM secrets").fetchone()[0]
+            self.db.execute("DELETE FROM secrets")
+        return count
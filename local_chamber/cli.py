@@ -7,14 +7,33 @@ from pathlib import Path
 
 import click
 
-from .archive import Backup, Restore
-from .chamber import ChamberError, EnvdirChamber, FileChamber, VaultChamber
+from .agent import AGENT_COMMANDS, Agent, AgentClient, default_socket_path
+from .chamber import (
+    ChamberError,
+    EnvdirChamber,
+    FileChamber,
+    SqliteChamber,
+    VaultChamber,
+)
+from .constants import (
+    COMPRESSION_SUFFIXES,
+    COMPRESSIONS,
+    DEFAULT_CACHE_TTL,
+    DEFAULT_COMPRESSION,
+    DEFAULT_CONCURRENCY,
+    DEFAULT_JOBS,
+    DEFAULT_PROFILE_TOP,
+    DEFAULT_RETRIES,
+    DEFAULT_TIMEOUT,
+    LAYOUTS,
+)
 from .shell import _shell_completion
+from .timings import CHAMBER_OPERATIONS, Timings
 from .version import __version__
 
 FORMATS = ["json", "yaml", "csv", "tsv", "dotenv", "tfvars"]
 
-BACKENDS = {"file": FileChamber, "envdir": EnvdirChamber, "vault": VaultChamber}
+BACKENDS = {"file": FileChamber, "envdir": EnvdirChamber, "vault": VaultChamber, "sqlite": SqliteChamber}
 
 
 class SysArgs:
@@ -30,6 +49,33 @@ class SysArgs:
         self.argv = args
 
 
+def _time_command(ctx, timings):
+    """time the backend primitives and output of ctx.obj, reporting to stderr when ctx closes"""
+    timings.instrument(ctx.obj, CHAMBER_OPERATIONS)
+    ctx.obj.echo = timings.timed("output", ctx.obj.echo)
+    timings.phase("setup")
+
+    def report_timings():
+        timings.phase("command")
+        timings.report(sys.stderr)
+
+    ctx.call_on_close(report_timings)
+
+
+def _profile_command(ctx, path, top):
+    """profile the rest of the command, writing the reports when ctx closes"""
+    from .profiling import Profiler
+
+    profiler = Profiler(path, top=top)
+
+    def write_profile():
+        paths = profiler.stop()
+        click.echo(f"Wrote profile to {paths[0]} and allocations to {paths[1]}", err=True)
+
+    ctx.call_on_close(write_profile)
+    profiler.start()
+
+
 @click.group("local_chamber")
 @click.version_option()
 @click.option(
@@ -57,8 +103,124 @@ class SysArgs:
     show_envvar=True,
     help="secrets directory",
 )
+@click.option(
+    "--sqlite-file",
+    default=Path(".secrets.db"),
+    type=click.Path(dir_okay=False, writable=True, resolve_path=True, path_type=Path),
+    envvar="SECRETS_SQLITE_FILE",
+    show_envvar=True,
+    help="sqlite backend database, created if missing",
+)
+@click.option(
+    "--file-journal/--no-file-journal",
+    is_flag=True,
+    default=False,
+    envvar="SECRETS_FILE_JOURNAL",
+    show_envvar=True,
+    help="append file backend changes to a journal instead of rewriting the secrets file",
+)
+@click.option(
+    "--file-index/--no-file-index",
+    is_flag=True,
+    default=False,
+    envvar="SECRETS_FILE_INDEX",
+    show_envvar=True,
+    help="serve file backend reads from a memory-mapped sidecar index instead of parsing the secrets file",
+)
 @click.option("-t", "--token", type=str, envvar="SECRETS_TOKEN")
 @click.option("-r", "--root", type=str, default="chamber", envvar="SECRETS_ROOT")
+@click.option(
+    "--vault-layout",
+    type=click.Choice(LAYOUTS),
+    default="key",
+    envvar="SECRETS_VAULT_LAYOUT",
+    show_envvar=True,
+    help="vault storage layout: one KV secret per key, or one per service",
+)
+@click.option(
+    "--vault-concurrency",
+    type=click.IntRange(min=1),
+    default=DEFAULT_CONCURRENCY,
+    envvar="SECRETS_VAULT_CONCURRENCY",
+    show_envvar=True,
+    help="maximum concurrent vault requests",
+)
+@click.option(
+    "--vault-timeout",
+    type=(float, float),
+    default=DEFAULT_TIMEOUT,
+    envvar="SECRETS_VAULT_TIMEOUT",
+    show_envvar=True,
+    help="vault connect and read timeouts in seconds",
+)
+@click.option(
+    "--vault-retries",
+    type=click.IntRange(min=0),
+    default=DEFAULT_RETRIES,
+    envvar="SECRETS_VAULT_RETRIES",
+    show_envvar=True,
+    help="retries on vault connection errors and 429/5xx responses",
+)
+@click.option(
+    "--vault-cache/--no-vault-cache",
+    is_flag=True,
+    default=False,
+    envvar="SECRETS_VAULT_CACHE",
+    show_envvar=True,
+    help="serve vault reads from an encrypted on-disk cache shared between invocations",
+)
+@click.option(
+    "--vault-cache-ttl",
+    type=click.FloatRange(min=0),
+    default=DEFAULT_CACHE_TTL,
+    envvar="SECRETS_VAULT_CACHE_TTL",
+    show_envvar=True,
+    help="seconds a cached vault service is used before its versions are revalidated",
+)
+@click.option(
+    "--vault-cache-dir",
+    type=click.Path(file_okay=False, resolve_path=True, path_type=Path),
+    envvar="SECRETS_VAULT_CACHE_DIR",
+    show_envvar=True,
+    help="vault cache directory [default: $XDG_CACHE_HOME/local_chamber/vault]",
+)
+@click.option(
+    "--agent/--no-agent",
+    is_flag=True,
+    default=False,
+    envvar="SECRETS_AGENT",
+    show_envvar=True,
+    help="serve read-only commands from a running agent when its socket accepts connections",
+)
+@click.option(
+    "--agent-socket",
+    type=click.Path(dir_okay=False, resolve_path=True, path_type=Path),
+    envvar="SECRETS_AGENT_SOCKET",
+    show_envvar=True,
+    help="agent socket path [default: $XDG_RUNTIME_DIR/local_chamber/BACKEND.sock, else /tmp/local_chamber-UID/BACKEND.sock]",
+)
+@click.option(
+    "--timings",
+    is_flag=True,
+    envvar="SECRETS_TIMINGS",
+    show_envvar=True,
+    help="write per-phase wall times and backend operation counters to stderr as JSON",
+)
+@click.option(
+    "--profile",
+    type=click.Path(dir_okay=False, writable=True, resolve_path=True, path_type=Path),
+    envvar="SECRETS_PROFILE",
+    show_envvar=True,
+    help="run the command under cProfile and tracemalloc, writing PATH (pstats) and PATH.allocations.txt",
+)
+@click.option(
+    "--profile-top",
+    type=click.IntRange(min=1),
+    default=DEFAULT_PROFILE_TOP,
+    envvar="SECRETS_PROFILE_TOP",
+    show_envvar=True,
+    help="allocation sites listed in the profile report",
+)
 @click.option(
     "-d",
     "--debug",
@@ -83,11 +245,70 @@ class SysArgs:
     help="(default) exit with error if service or key does not exist",
 )
 @click.pass_context
-def cli(ctx, secrets_file, secrets_dir, token, root, debug, backend, exists):
-
-    config = {"file": secrets_file, "dir": secrets_dir, "token": token, "root": root, "backend": backend}
+def cli(
+    ctx,
+    secrets_file,
+    secrets_dir,
+    sqlite_file,
+    file_journal,
+    file_index,
+    token,
+    root,
+    vault_layout,
+    vault_concurrency,
+    vault_timeout,
+    vault_retries,
+    vault_cache,
+    vault_cache_ttl,
+    vault_cache_dir,
+    agent,
+    agent_socket,
+    timings,
+    profile,
+    profile_top,
+    debug,
+    backend,
+    exists,
+):
+
+    config = {
+        "file": secrets_file,
+        "dir": secrets_dir,
+        "sqlite": sqlite_file,
+        "file_journal": file_journal,
+        "file_index": file_index,
+        "token": token,
+        "root": root,
+        "backend": backend,
+        "vault_layout": vault_layout,
+        "vault_concurrency": vault_concurrency,
+        "vault_timeout": vault_timeout,
+        "vault_retries": vault_retries,
+        "vault_cache": vault_cache,
+        "vault_cache_ttl": vault_cache_ttl,
+        "vault_cache_dir": vault_cache_dir,
+        "agent_socket": agent_socket or default_socket_path(backend),
+    }
+
+    if timings:
+        from . import IMPORT_STARTED
+
+        timings = Timings(started=IMPORT_STARTED)
+        timings.phase("import")
+        config["timings"] = timings
+
+    ctx.obj = None
+    if agent and ctx.invoked_subcommand in AGENT_COMMANDS:
+        ctx.obj = AgentClient.connect(
+            config["agent_socket"], BACKENDS[backend], config=config, debug=debug, echo=click.echo, require_exists=exists
+        )
+    if ctx.obj is None:
+        ctx.obj = BACKENDS[backend](config=config, debug=debug, echo=click.echo, require_exists=exists)
 
-    ctx.obj = BACKENDS[backend](config=config, debug=debug, echo=click.echo, require_exists=exists)
+    if timings:
+        _time_command(ctx, timings)
+    if profile:
+        _profile_command(ctx, profile, profile_top)
 
     def exception_handler(
         exception_type,
@@ -258,13 +479,30 @@ def edit(ctx, editor, service):
 
 @cli.command()
 @click.option("-r", "--regex", is_flag=True, help="enable regex search (local-only)")
+@click.option("-g", "--glob", is_flag=True, help="match shell-style globs instead of regular expressions")
 @click.option("-v", "--by-value", is_flag=True)
-@click.argument("key", type=str, required=True)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=DEFAULT_JOBS,
+    envvar="SECRETS_FIND_JOBS",
+    show_envvar=True,
+    help="number of services read concurrently by --by-value",
+)
+@click.argument("key", type=str, nargs=-1, required=True)
 @click.pass_context
-def find(ctx, key, by_value, regex):
-    """Find the given secret across all services"""
+def find(ctx, key, by_value, regex, glob, jobs):
+    """Find the given secret across all services
+
+    Each KEY is a regular expression matching the whole name, or with --regex
+    matching its start, or with --glob a shell-style glob; a secret matching any
+    KEY is reported.
+    """
+    if regex and glob:
+        raise ChamberError("Error: --regex and --glob are mutually exclusive")
     with ctx.obj as chamber:
-        ctx.exit(chamber.find(key, by_value, regex))
+        ctx.exit(chamber.find(key, by_value, regex, jobs, glob))
 
 
 @cli.command("import")
@@ -320,24 +558,74 @@ def write(ctx, service, key, value):
 
 @cli.command()
 @click.option("-f", "--filename", type=click.Path(exists=False, dir_okay=False, path_type=Path))
-@click.argument(
-    "output-path", type=click.Path(exists=True, file_okay=False, writable=True, resolve_path=True, path_type=Path), default="."
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=DEFAULT_JOBS,
+    envvar="SECRETS_BACKUP_JOBS",
+    show_envvar=True,
+    help="number of services exported concurrently",
+)
+@click.option(
+    "-i",
+    "--incremental-from",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    help="only export services changed since this backup tarball or manifest",
+)
+@click.option(
+    "-c",
+    "--compression",
+    type=click.Choice(COMPRESSIONS),
+    default=DEFAULT_COMPRESSION,
+    envvar="SECRETS_BACKUP_COMPRESSION",
+    show_envvar=True,
+    help="tarball compression codec",
+)
+@click.option(
+    "-L",
+    "--level",
+    type=click.IntRange(min=0, max=9),
+    envvar="SECRETS_BACKUP_LEVEL",
+    show_envvar=True,
+    help="compression level; defaults to 9 for gz and bz2, 6 for xz",
 )
+@click.argument("output-path", type=click.Path(exists=True, writable=True, allow_dash=True, path_type=Path), default=".")
 @click.pass_context
-def backup(ctx, filename, output_path):
-    """write secrets data as a gzipped tarball on OUTPUT-PATH
+def backup(ctx, filename, jobs, incremental_from, compression, level, output_path):
+    """write secrets data as a compressed tarball on OUTPUT-PATH
 
     A timestamp-based filename will be generated.
     Use the --filename option to specify an output filename.
-    OUTPUT-PATH defaults to the current directory.
+    OUTPUT-PATH defaults to the current directory; use '-' to write the tarball to stdout.
+    A manifest of service content hashes is written into the tarball and alongside it;
+    pass a previous tarball or manifest to --incremental-from to export only the changes.
     """
 
-    if filename and filename.suffix != ".tgz":
-        filename = Path(str(filename) + ".tgz")
+    from .archive import Backup, read_manifest
+
+    suffix = COMPRESSION_SUFFIXES[compression]
+    if filename and filename.suffix != suffix:
+        filename = Path(str(filename) + suffix)
+    if str(output_path) != "-":
+        if not output_path.is_dir():
+            raise click.BadParameter(f"'{output_path}' is not a directory", param_hint="OUTPUT-PATH")
+        output_path = output_path.resolve()
 
     with ctx.obj as chamber:
-        msg = Backup(chamber=chamber, output_path=output_path, file_name=filename).write()
-    click.echo(msg)
+        base_manifest = read_manifest(incremental_from) if incremental_from else None
+        backup = Backup(
+            chamber=chamber,
+            output_path=output_path,
+            file_name=filename,
+            jobs=jobs,
+            base_manifest=base_manifest,
+            compression=compression,
+            level=level,
+        )
+        msg = backup.write()
+    click.echo(msg, err=str(output_path) == "-")
+    click.echo(backup.summary(), err=True)
     ctx.exit(0)
 
 
@@ -345,23 +633,81 @@ def backup(ctx, filename, output_path):
 @click.option("-p", "--patch", is_flag=True, help="merge restore data into current without deleting existing values")
 @click.option("-f", "--force", is_flag=True, help="bypass confirmation")
 @click.argument("input", type=click.Path(exists=True, dir_okay=False, allow_dash=True, path_type=Path), default="-")
+@click.argument("increments", type=click.Path(exists=True, dir_okay=False, path_type=Path), nargs=-1)
 @click.pass_context
-def restore(ctx, input, force, patch):
-    """restore secrets data from a gzipped tarball file
+def restore(ctx, input, increments, force, patch):
+    """restore secrets data from a backup tarball, detecting its compression
 
     Unless --patch is selected, all existing data is purged before restoring.
-
+    INPUT defaults to '-', reading the tarball from stdin; this requires --force.
+    Any INCREMENTS are incremental backup tarballs replayed in order on top of INPUT.
     """
 
+    from .archive import Restore
+
     if not force:
+        if str(input) == "-":
+            raise ChamberError("Error: restore from stdin requires --force")
         click.confirm("Restore will DESTRUCTIVELY overwrite existing data.", abort=True)
 
     with ctx.obj as chamber:
-        msg = Restore(chamber=chamber, tarball=input, patch=patch, echo=click.echo).read()
+        msg = Restore(chamber=chamber, tarball=input, patch=patch, echo=click.echo, increments=increments).read()
     click.echo(msg)
     ctx.exit(0)
 
 
+@cli.command()
+@click.option("-l", "--layout", type=click.Choice(LAYOUTS), default="service", help="target vault storage layout")
+@click.option("-f", "--force", is_flag=True, help="bypass confirmation")
+@click.argument("service", type=str, default=None, required=False)
+@click.pass_context
+def migrate(ctx, layout, force, service):
+    """convert vault secrets to another storage layout in place
+
+    Converts SERVICE and all of its subservices, or the whole store if SERVICE is omitted.
+    Both layouts remain readable; clients sharing a store should use the same --vault-layout.
+    """
+    if not force:
+        click.confirm(f"About to rewrite {service or 'all services'} in the '{layout}' layout.", abort=True)
+    with ctx.obj as chamber:
+        ctx.exit(chamber.migrate(service, layout))
+
+
+@cli.command()
+@click.pass_context
+def agent(ctx):
+    """serve read-only commands from this backend over a Unix socket until interrupted"""
+    Agent(ctx.obj, ctx.obj.config["agent_socket"], echo=click.echo).run()
+    ctx.exit(0)
+
+
+@cli.group()
+def cache():
+    """manage the vault read cache"""
+
+
+@cache.command("clear")
+@click.pass_context
+def cache_clear(ctx):
+    """delete every cached vault entry"""
+    from .cache import SecretsCache
+
+    count = SecretsCache.from_config(ctx.obj.config).clear()
+    click.echo(f"Deleted {count} cache entries.")
+    ctx.exit(0)
+
+
+@cache.command("stats")
+@click.pass_context
+def cache_stats(ctx):
+    """show vault cache entry counts, size and ages"""
+    from .cache import SecretsCache
+
+    for name, value in SecretsCache.from_config(ctx.obj.config).stats().items():
+        click.echo(f"{name}\t{value}")
+    ctx.exit(0)
+
+
 @cli.command()
 @click.option("-s", "--shell", type=click.Choice(["bash", "zsh", "[auto]"]), default="[auto]")
 def shell_completion(shell):
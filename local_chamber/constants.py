@@ -0,0 +1,30 @@
+# settings shared by the cli and the vault backend; kept free of heavy imports so the cli can load quickly
+
+# leaf name holding every key of a service in the "service" layout
+SERVICE_DOCUMENT = "__service__"
+
+# "key": one KV secret per key at /service/key; "service": one KV secret per service at /service/__service__
+LAYOUTS = ["key", "service"]
+
+# maximum number of vault requests in flight at once
+DEFAULT_CONCURRENCY = 8
+
+# (connect, read) timeout in seconds
+DEFAULT_TIMEOUT = (5.0, 30.0)
+
+# retries for vault connection errors and retryable status responses
+DEFAULT_RETRIES = 3
+
+# services exported concurrently by backup
+DEFAULT_JOBS = 4
+
+# backup tarball compression codecs and the file suffix each is written with
+COMPRESSION_SUFFIXES = {"gz": ".tgz", "bz2": ".tbz2", "xz": ".txz", "none": ".tar"}
+COMPRESSIONS = ["gz", "bz2", "xz", "none"]
+DEFAULT_COMPRESSION = "gz"
+
+# seconds a cached vault service is served before its versions are revalidated
+DEFAULT_CACHE_TTL = 60
+
+# allocation sites listed in the --profile report
+DEFAULT_PROFILE_TOP = 25
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+
+import json
+import mmap
+import re
+from json.decoder import scanstring
+from os import fdopen, fstat, replace, unlink
+from pathlib import Path
+from tempfile import mkstemp
+
+MAGIC = b"local_chamber-index 1"
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+class FileIndex:
+    """sorted, memory-mapped sidecar mapping (service, key) to the byte span of each value in a secrets file
+
+    The index file starts with a header line identifying the secrets file it was built from
+    (inode, size, mtime); it is rebuilt whenever that no longer matches.  Each following line is
+    "<service>\\t<key>\\t<start>\\t<end>" with JSON-encoded names, sorted so all keys of a service
+    are adjacent and can be found by binary search.
+    """
+
+    def __init__(self, secrets_file):
+        self.secrets_file = Path(secrets_file).resolve()
+        self.index_file = Path(str(self.secrets_file) + ".index").resolve()
+        self.data = None
+        self.index = None
+        self.start = 0
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, _, ex, tb):
+        self.close()
+
+    def open(self):
+        with self.secrets_file.open("rb") as ifp:
+            self.data = mmap.mmap(ifp.fileno(), 0, access=mmap.ACCESS_READ)
+            header = self._header(fstat(ifp.fileno()))
+        if not self._open_index(header):
+            self._build(header)
+            if not self._open_index(header):
+                raise RuntimeError(f"failed to build index {self.index_file}")
+
+    def close(self):
+        for m in [self.index, self.data]:
+            if m is not None:
+                m.close()
+        self.index = None
+        self.data = None
+
+    def _header(self, stat):
+        return MAGIC + f" {stat.st_ino} {stat.st_size} {stat.st_mtime_ns}\n".encode()
+
+    def _open_index(self, header):
+        try:
+            with self.index_file.open("rb") as ifp:
+                if ifp.readline() != header:
+                    return False
+                self.index = mmap.mmap(ifp.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            return False
+        self.start = len(header)
+        return True
+
+    def _build(self, header):
+        """scan the secrets file for value spans and atomically write a new index"""
+        entries = []
+        # latin-1 maps each byte to one character, so string offsets are byte offsets
+        text = self.data[:].decode("latin-1")
+        idx = WHITESPACE.match(text, 0).end()
+        if text[idx : idx + 1] == "{":
+            self._scan_object(text, idx, [], entries)
+        lines = sorted(
+            b"\t".join([self._encode(service), self._encode(key), b"%d" % start, b"%d" % end]) + b"\n"
+            for service, key, start, end in entries
+        )
+        fd, temp_file = mkstemp(dir=self.index_file.parent, prefix=f".{self.index_file.name}.", suffix=".tmp")
+        try:
+            with fdopen(fd, "wb") as ofp:
+                ofp.write(header)
+                ofp.writelines(lines)
+            replace(temp_file, self.index_file)
+        except BaseException:
+            unlink(temp_file)
+            raise
+
+    def _scan_object(self, text, idx, path, entries):
+        """record spans of the non-object values in the object at text[idx]; return the index past it"""
+        idx = WHITESPACE.match(text, idx + 1).end()
+        if text[idx] == "}":
+            return idx + 1
+        decoder = json.JSONDecoder()
+        while True:
+            key_start = idx
+            _, idx = scanstring(text, idx + 1)
+            key = json.loads(self.data[key_start:idx].decode())
+            idx = self._expect(text, idx, ":")
+            if text[idx] == "{":
+                idx = self._scan_object(text, idx, path + [key], entries)
+            else:
+                _, end = decoder.raw_decode(text, idx)
+                if path:
+                    entries.append(("/".join(path), key, idx, end))
+                idx = end
+            idx = WHITESPACE.match(text, idx).end()
+            if text[idx] == "}":
+                return idx + 1
+            idx = self._expect(text, idx, ",")
+
+    def _expect(self, text, idx, delimiter):
+        """return the index of the next token after delimiter at text[idx]"""
+        idx = WHITESPACE.match(text, idx).end()
+        if text[idx : idx + 1] != delimiter:
+            raise json.JSONDecodeError(f"Expecting '{delimiter}' delimiter", text, idx)
+        return WHITESPACE.match(text, idx + 1).end()
+
+    def _encode(self, name):
+        return json.dumps(name).encode()
+
+    def _lower_bound(self, prefix):
+        """return the offset of the first index line not less than prefix"""
+        lo = self.start
+        hi = len(self.index)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            line_start = max(self.index.rfind(b"\n", lo, mid) + 1, lo)
+            line_end = self.index.find(b"\n", line_start) + 1
+            if self.index[line_start:line_end] < prefix:
+                lo = line_end
+            else:
+                hi = line_start
+        return lo
+
+    def entries(self, service):
+        """return [(key, start, end)] for the values of service"""
+        prefix = self._encode(service) + b"\t"
+        ret = []
+        offset = self._lower_bound(prefix)
+        while offset < len(self.index):
+            end = self.index.find(b"\n", offset)
+            line = self.index[offset:end]
+            if not line.startswith(prefix):
+                break
+            _, key, start, stop = line.split(b"\t")
+            ret.append((json.loads(key), int(start), int(stop)))
+            offset = end + 1
+        return ret
+
+    def services(self, prefix=None):
+        """return the sorted services equal to prefix or below it, or all services"""
+        # a JSON-encoded service is a prefix of its subservices' encodings up to the closing quote
+        start = b'"' if prefix is None else self._encode(prefix)[:-1]
+        services = set()
+        offset = self._lower_bound(start)
+        while offset < len(self.index):
+            end = self.index.find(b"\n", offset)
+            line = self.index[offset:end]
+            if not line.startswith(start):
+                break
+            services.add(json.loads(line.split(b"\t", 1)[0]))
+            offset = end + 1
+        if prefix is not None:
+            services = [s for s in services if s == prefix or s.startswith(prefix + "/")]
+        return sorted(services)
+
+    def keys(self, service):
+        return [key for key, _, _ in self.entries(service)]
+
+    def secrets(self, service):
+        return {key: json.loads(self.data[start:end].decode()) for key, start, end in self.entries(service)}
+
+    def get(self, service, key):
+        for _key, start, end in self.entries(service):
+            if _key == key:
+                return json.loads(self.data[start:end].decode())
+        return None
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+
+import cProfile
+import tracemalloc
+from pathlib import Path
+
+from .constants import DEFAULT_PROFILE_TOP
+
+
+def _size(nbytes):
+    for unit in ["B", "KiB", "MiB"]:
+        if abs(nbytes) < 1024:
+            return f"{nbytes:.1f} {unit}"
+        nbytes /= 1024
+    return f"{nbytes:.1f} GiB"
+
+
+class Profiler:
+    """profile one cli command with cProfile and tracemalloc
+
+    stop() writes the cProfile stats to path, readable with pstats or snakeviz, and the traced
+    peak plus the top sites of still-allocated memory by line to path.allocations.txt.  cProfile only sees the
+    thread that started it, so work done in backup or vault worker threads is attributed to the
+    waits on their results; tracemalloc counts allocations from every thread.
+    """
+
+    def __init__(self, path, top=DEFAULT_PROFILE_TOP):
+        self.path = Path(path)
+        self.top = top
+        self.profile = cProfile.Profile()
+
+    @property
+    def allocations_file(self):
+        return self.path.with_name(self.path.name + ".allocations.txt")
+
+    def start(self):
+        tracemalloc.start()
+        self.profile.enable()
+
+    def stop(self):
+        """stop profiling and write both reports; return their paths"""
+        self.profile.disable()
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.profile.dump_stats(str(self.path))
+        snapshot = snapshot.filter_traces(
+            [
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, __file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+            ]
+        )
+        lines = [f"traced memory: current {_size(current)}, peak {_size(peak)}", ""]
+        lines.append(f"top {self.top} sites of memory still allocated when the command finished, by size:")
+        for rank, stat in enumerate(snapshot.statistics("lineno")[: self.top], 1):
+            frame = stat.traceback[0]
+            lines.append(f"{rank:4d}. {frame.filename}:{frame.lineno}: {_size(stat.size)} in {stat.count} blocks")
+        self.allocations_file.write_text("\n".join(lines) + "\n")
+        return self.path, self.allocations_file
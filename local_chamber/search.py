@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+
+import fnmatch
+import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+REGEX_CHARS = set(".^$*+?{}[]\\|()")
+
+
+class Matcher:
+    """match text against several patterns, each compiled once
+
+    By default a pattern is a regular expression anchored at both ends; with regex it is
+    matched at the start of the text as re.match does, and with glob it is a shell-style glob
+    matching the whole text.  A default pattern without regular expression metacharacters can
+    only match itself, so it is compared by set lookup instead.
+    """
+
+    def __init__(self, patterns, regex=False, glob=False):
+        literals = set()
+        expressions = []
+        for pattern in patterns:
+            if regex:
+                expressions.append(pattern)
+            elif glob:
+                expressions.append(fnmatch.translate(pattern))
+            elif REGEX_CHARS.intersection(pattern):
+                expressions.append("^" + pattern + "$")
+            else:
+                literals.add(pattern)
+        self.literals = frozenset(literals)
+        self.expressions = [re.compile(expression) for expression in expressions]
+
+    def __call__(self, text):
+        if text in self.literals:
+            return True
+        return any(expression.match(text) for expression in self.expressions)
+
+
+def ordered_map(func, items, jobs=1):
+    """yield (item, func(item)) in item order, running up to jobs calls ahead of the consumer"""
+    if jobs <= 1:
+        for item in items:
+            yield item, func(item)
+        return
+    with ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="search") as pool:
+        pending = deque()
+        for item in items:
+            pending.append((item, pool.submit(func, item)))
+            if len(pending) >= 2 * jobs:
+                item, future = pending.popleft()
+                yield item, future.result()
+        while pending:
+            item, future = pending.popleft()
+            yield item, future.result()
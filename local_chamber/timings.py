@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+import inspect
+import json
+import math
+import threading
+import time
+from collections import Counter, defaultdict
+from functools import wraps
+
+# chamber backend primitives timed by --timings
+CHAMBER_OPERATIONS = ["_list_services", "_walk", "_keys", "_secrets", "_read", "_write", "_delete", "_list"]
+
+
+def _percentile(samples, fraction):
+    """return the nearest-rank percentile of sorted samples"""
+    return samples[max(0, math.ceil(fraction * len(samples)) - 1)]
+
+
+class Timings:
+    """wall time per phase and per operation, and I/O counters, for one cli invocation
+
+    Phases are consecutive: each call to phase() closes the interval since the previous one.
+    Operations are timed by wrapping callables, and may run on several threads.
+    """
+
+    def __init__(self, started=None):
+        self.started = time.perf_counter() if started is None else started
+        self.mark = self.started
+        self.phases = {}
+        self.samples = defaultdict(list)
+        self.counters = Counter()
+        self.lock = threading.Lock()
+
+    def phase(self, name):
+        now = time.perf_counter()
+        self.phases[name] = self.phases.get(name, 0.0) + now - self.mark
+        self.mark = now
+
+    def record(self, name, seconds):
+        with self.lock:
+            self.samples[name].append(seconds)
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] += n
+
+    def timed(self, name, func):
+        """return func wrapped to record each call's wall time under name"""
+
+        @wraps(func)
+        def _timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.record(name, time.perf_counter() - start)
+
+        return _timed
+
+    def timed_iter(self, name, func):
+        """return generator function func wrapped to record, per call, the wall time spent producing its items"""
+
+        @wraps(func)
+        def _timed(*args, **kwargs):
+            elapsed = 0.0
+            iterator = None
+            try:
+                while True:
+                    start = time.perf_counter()
+                    try:
+                        if iterator is None:
+                            iterator = iter(func(*args, **kwargs))
+                        item = next(iterator)
+                    except StopIteration:
+                        return
+                    finally:
+                        elapsed += time.perf_counter() - start
+                    yield item
+            finally:
+                if iterator is not None and hasattr(iterator, "close"):
+                    iterator.close()
+                self.record(name, elapsed)
+
+        return _timed
+
+    def instrument(self, obj, names):
+        """replace each named method of obj, on the instance, with a timed wrapper"""
+        for name in names:
+            method = getattr(obj, name)
+            timed = self.timed_iter if inspect.isgeneratorfunction(method) else self.timed
+            setattr(obj, name, timed(name.lstrip("_"), method))
+
+    def instrument_session(self, session):
+        """time each HTTP request of a requests session by method, and count response bytes"""
+        request = session.request
+
+        @wraps(request)
+        def _request(method, url, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                response = request(method, url, *args, **kwargs)
+            finally:
+                self.record(f"vault {method.upper()}", time.perf_counter() - start)
+            self.count("bytes_read", len(response.content))
+            return response
+
+        session.request = _request
+
+    def summary(self):
+        """return the JSON-ready report; times are in milliseconds"""
+        operations = {}
+        for name, samples in sorted(self.samples.items()):
+            samples = sorted(samples)
+            operations[name] = {
+                "count": len(samples),
+                "total": round(sum(samples) * 1000, 3),
+                "p50": round(_percentile(samples, 0.50) * 1000, 3),
+                "p95": round(_percentile(samples, 0.95) * 1000, 3),
+            }
+        return {
+            "elapsed": round((self.mark - self.started) * 1000, 3),
+            "phases": {name: round(seconds * 1000, 3) for name, seconds in self.phases.items()},
+            "operations": operations,
+            "counters": dict(sorted(self.counters.items())),
+        }
+
+    def report(self, ofp):
+        ofp.write(json.dumps(self.summary(), indent=2) + "\n")
@@ -1,17 +1,105 @@
 #!/usr/bin/env python3
 
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import hvac
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
+from .constants import (
+    DEFAULT_CONCURRENCY,
+    DEFAULT_RETRIES,
+    DEFAULT_TIMEOUT,
+    LAYOUTS,
+    SERVICE_DOCUMENT,
+)
 from .exception import ChamberError
 
+RETRY_STATUS = [429, 500, 502, 503, 504]
+RETRY_BACKOFF = 0.25
+
+
+class JitterRetry(Retry):
+    """urllib3 Retry adding up to 100% random jitter to the exponential backoff"""
+
+    def get_backoff_time(self):
+        backoff = super().get_backoff_time()
+        return backoff + random.uniform(0, backoff)
+
 
 class VaultSecrets:
-    def __init__(self, base="chamber"):
+    def __init__(
+        self,
+        base="chamber",
+        layout="key",
+        concurrency=DEFAULT_CONCURRENCY,
+        token=None,
+        timeout=DEFAULT_TIMEOUT,
+        retries=DEFAULT_RETRIES,
+        timings=None,
+    ):
+        if layout not in LAYOUTS:
+            raise ChamberError(f"Error: unknown vault layout: '{layout}'")
         self.base = base
-        self.client = hvac.Client()
+        self.layout = layout
+        self.concurrency = max(1, int(concurrency))
+        self.pool = None
+        self.pool_lock = threading.Lock()
+        self.session = self._session(self.concurrency, retries)
+        if timings is not None:
+            timings.instrument_session(self.session)
+        self.client = hvac.Client(token=token, timeout=tuple(timeout), session=self.session)
         self.client.secrets.kv.default_kv_version = 2
         self.kv = self.client.secrets.kv.v2
 
+    @classmethod
+    def from_config(cls, config):
+        """return VaultSecrets configured from the cli config dict"""
+        return cls(
+            base=config.get("root") or "chamber",
+            layout=config.get("vault_layout", "key"),
+            concurrency=config.get("vault_concurrency", DEFAULT_CONCURRENCY),
+            token=config.get("token"),
+            timeout=config.get("vault_timeout", DEFAULT_TIMEOUT),
+            retries=config.get("vault_retries", DEFAULT_RETRIES),
+            timings=config.get("timings"),
+        )
+
+    def _session(self, concurrency, retries):
+        """return a keep-alive session pooling one connection per worker, retrying with jittered backoff"""
+        retry = JitterRetry(
+            total=retries,
+            status_forcelist=RETRY_STATUS,
+            allowed_methods=None,
+            backoff_factor=RETRY_BACKOFF,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency, pool_block=True, max_retries=retry)
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        self.pool_lock = threading.Lock()
+        self.session.close()
+
+    def map(self, func, items):
+        """return [func(item) for item in items], running up to concurrency calls at once"""
+        items = list(items)
+        if self.concurrency == 1 or len(items) < 2:
+            return [func(item) for item in items]
+        with self.pool_lock:
+            if self.pool is None:
+                self.pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="vault")
+        return list(self.pool.map(func, items))
+
     def _count(self, char, string):
         return len([c for c in string if c == char])
 
@@ -26,22 +114,38 @@ class VaultSecrets:
             ret = sorted(list_response["data"]["keys"])
         return ret
 
+    def leaves(self, path):
+        """return the KV secret names stored directly under path, including any service document"""
+        return [key for key in self.secrets(path, require_exists=False) if not key.endswith("/")]
+
     def keys(self, path, require_exists=True):
-        keys = [key for key in self.secrets(path, require_exists=False) if not key.endswith("/")]
+        return self.keys_from_leaves(path, self.leaves(path))
+
+    def keys_from_leaves(self, path, leaves):
+        """return the key names of path given its leaves, reading the service document only if it is listed"""
+        keys = set(leaves) - set([SERVICE_DOCUMENT])
+        if SERVICE_DOCUMENT in leaves:
+            keys.update(self._document_data(path).keys())
         return sorted(keys)
 
+    def tree(self, path):
+        """return {service: leaves} for the tree under path, listing one level at a time with each level fetched concurrently"""
+        ret = {}
+        pending = [path]
+        while pending:
+            listings = self.map(lambda _path: self.secrets(_path, require_exists=False), pending)
+            subpaths = []
+            for _path, keys in zip(pending, listings):
+                leaves = [key for key in keys if not key.endswith("/")]
+                subpaths.extend(f"/{_path.strip('/')}/{key}" for key in keys if key.endswith("/"))
+                if leaves and _path.strip("/"):
+                    ret[_path.strip("/")] = leaves
+            pending = subpaths
+        return dict(sorted(ret.items()))
+
     def _services(self, path):
-        ret = []
-        for key in self.secrets(path, require_exists=False):
-            if key.endswith("/"):
-                subpath = f"/{path.strip('/')}/{key}"
-                sub_services = self._services(subpath)
-                ret.extend(sub_services)
-            else:
-                ret.append(path.strip("/") + "/")
-        ret = [r.strip("/") for r in ret]
-        ret = [r for r in ret if len(r)]
-        return sorted(list(set(ret)))
+        """list the services under path"""
+        return list(self.tree(path))
 
     def services(self, path):
         ret = self._services(path)
@@ -50,22 +154,45 @@ class VaultSecrets:
     def delete(self, path, require_exists=True):
         self.kv.delete_metadata_and_all_versions(mount_point=self.base, path="/" + path)
 
+    def delete_key(self, path, key, leaves=None):
+        """delete key from path in whichever layout holds it
+
+        leaves, the names listed under path when the caller has them, spares reading a service
+        document that is not there; the leaves remaining after the delete are returned.
+        """
+        has_document = leaves is None or SERVICE_DOCUMENT in leaves
+        document = self._document_data(path) if has_document else {}
+        if key in document:
+            document.pop(key)
+            if document:
+                self._write_document(path, document)
+            else:
+                self.delete(f"{path}/{SERVICE_DOCUMENT}")
+                has_document = False
+        self.delete(f"{path}/{key}")
+        if leaves is None:
+            return None
+        return [leaf for leaf in leaves if leaf != key and (leaf != SERVICE_DOCUMENT or has_document)]
+
     def delete_tree(self, path):
-        self._walk_tree(path, self.delete)
+        """delete every secret under path; return the number of services deleted"""
+        count = self._walk_tree(path, self.delete)
         if path != "/":
             self.delete(path)
+        return count
 
-    def _walk_tree(self, path, func):
+    def _tree_levels(self, path):
+        """return the KV paths under path grouped by depth, deepest level first"""
         levels = {}
-        for service in self.services(path):
-            level = self._count("/", service)
-            levels.setdefault(level, [])
-            levels[level].append(service)
+        for service, leaves in self.tree(path).items():
+            levels.setdefault(self._count("/", service), []).extend(self._mkpath(service, key) for key in leaves)
+        return [levels[level] for level in sorted(levels.keys(), reverse=True)]
 
-        for level in sorted(levels.keys(), reverse=True):
-            for path in levels[level]:
-                for key in self.keys(path):
-                    func(self._mkpath(path, key))
+    def _walk_tree(self, path, func):
+        levels = self._tree_levels(path)
+        for paths in levels:
+            self.map(func, paths)
+        return sum(len(set(path.rsplit("/", 1)[0] for path in paths)) for paths in levels)
 
     def _mkpath(self, path, key):
         if path.strip("/") is None:
@@ -75,20 +202,146 @@ class VaultSecrets:
         return _path
 
     def set(self, path, key, value):
+        if self.layout == "service":
+            document = self._document_data(path)
+            document[key] = value
+            self._write_document(path, document)
+        else:
+            self._set_leaf(path, key, value)
+
+    def _set_leaf(self, path, key, value):
         _path = self._mkpath(path, key)
         secret = {key: value}
         self.kv.create_or_update_secret(mount_point=self.base, path=_path, secret=secret)
 
-    def _get(self, path, key):
+    def set_service(self, path, secrets):
+        """write several keys of one service: a single document update, or concurrent per-key writes"""
+        if self.layout == "service":
+            document = self._document_data(path)
+            document.update(secrets)
+            self._write_document(path, document)
+        else:
+            self.map(lambda key: self._set_leaf(path, key, secrets[key]), secrets)
+
+    def _write_document(self, path, document):
+        _path = self._mkpath(path, SERVICE_DOCUMENT)
+        self.kv.create_or_update_secret(mount_point=self.base, path=_path, secret=document)
+
+    def _document(self, path):
+        """return the read response for the service document at path, or None"""
+        try:
+            return self.kv.read_secret_version(mount_point=self.base, path=self._mkpath(path, SERVICE_DOCUMENT))
+        except hvac.exceptions.InvalidPath:
+            return None
+
+    def _document_data(self, path):
+        document = self._document(path)
+        return {} if document is None else dict(document["data"]["data"])
+
+    def _get_leaf(self, path, key):
         _path = self._mkpath(path, key)
         return self.kv.read_secret_version(mount_point=self.base, path=_path)
 
+    def _get_document(self, path, key):
+        document = self._document(path)
+        if document is None:
+            raise hvac.exceptions.InvalidPath(f"no service document at {path}")
+        return document
+
+    def _get(self, path, key):
+        """return the read response holding key, trying the configured layout's location first"""
+        readers = [self._get_leaf, self._get_document]
+        if self.layout == "service":
+            readers.reverse()
+        for reader in readers:
+            try:
+                response = reader(path, key)
+            except hvac.exceptions.InvalidPath:
+                continue
+            if key in response["data"]["data"]:
+                return response
+        raise hvac.exceptions.InvalidPath(f"secret not found: {path}/{key}")
+
     def get(self, path, key):
         secret = self._get(path, key)["data"]["data"]
         return secret[key]
 
-    def get_metadata(self, path, key):
-        return self._get(path, key)["data"]["metadata"]
+    def get_service(self, path):
+        """return all secrets in path as a dict; a service document is read with a single request"""
+        return self.get_service_versions(path)[0]
+
+    def get_service_versions(self, path):
+        """return (secrets, {leaf: version}, {key: (version, created_time)}) for path from one round of reads"""
+        leaves = self.leaves(path)
+        keys = [key for key in leaves if key != SERVICE_DOCUMENT]
+        responses = dict(zip(keys, self.map(lambda key: self._get_leaf(path, key)["data"], keys)))
+        if SERVICE_DOCUMENT in leaves:
+            document = self._document(path)
+            if document is not None:
+                responses[SERVICE_DOCUMENT] = document["data"]
+        # later sources win: the document overrides per-key leaves in the "service" layout
+        order = [SERVICE_DOCUMENT] + keys if self.layout == "key" else keys + [SERVICE_DOCUMENT]
+        secrets = {}
+        metadata = {}
+        for leaf in order:
+            if leaf not in responses:
+                continue
+            data = responses[leaf]["data"]
+            if leaf != SERVICE_DOCUMENT:
+                data = {leaf: data[leaf]}
+            secrets.update(data)
+            version = responses[leaf]["metadata"]
+            metadata.update({key: (version["version"], version["created_time"]) for key in data})
+        versions = {leaf: responses[leaf]["metadata"]["version"] for leaf in responses}
+        return secrets, versions, metadata
+
+    def leaf_versions(self, path):
+        """return {leaf: current version} for path from its KV v2 metadata, without reading values"""
+        leaves = self.leaves(path)
+        return dict(zip(leaves, self.map(lambda leaf: self._read_metadata(path, leaf)["current_version"], leaves)))
+
+    def get_with_metadata(self, path, key):
+        """return (value, version metadata) of key from a single read"""
+        response = self._get(path, key)["data"]
+        return response["data"][key], response["metadata"]
+
+    def _read_metadata(self, path, key):
+        return self.kv.read_secret_metadata(mount_point=self.base, path=self._mkpath(path, key))["data"]
+
+    def list_metadata(self, path):
+        """return {key: KV v2 metadata} for path using the metadata endpoint
+
+        Per-key secrets are never read; keys held in a service document share its metadata,
+        and the document is read once to learn their names.
+        """
+        leaves = self.leaves(path)
+        keys = [key for key in leaves if key != SERVICE_DOCUMENT]
+        metadata = dict(zip(keys, self.map(lambda key: self._read_metadata(path, key), keys)))
+        if SERVICE_DOCUMENT in leaves:
+            document_metadata = self._read_metadata(path, SERVICE_DOCUMENT)
+            for key in self._document_data(path):
+                if self.layout == "service" or key not in metadata:
+                    metadata[key] = document_metadata
+        return {key: metadata[key] for key in sorted(metadata)}
+
+    def migrate(self, path, layout):
+        """convert every service under path to layout in place; return the converted services"""
+        if layout not in LAYOUTS:
+            raise ChamberError(f"Error: unknown vault layout: '{layout}'")
+        converted = []
+        for service, leaves in self.tree(path).items():
+            keys = [key for key in leaves if key != SERVICE_DOCUMENT]
+            if layout == "service" and keys:
+                self._write_document(service, self.get_service(service))
+                self.map(self.delete, [f"{service}/{key}" for key in keys])
+            elif layout == "key" and SERVICE_DOCUMENT in leaves:
+                secrets = self.get_service(service)
+                self.map(lambda key: self._set_leaf(service, key, secrets[key]), secrets)
+                self.delete(f"{service}/{SERVICE_DOCUMENT}")
+            else:
+                continue
+            converted.append(service)
+        return converted
 
     def load(self, path, data):
         for k, v in data.items():
@@ -98,21 +351,34 @@ class VaultSecrets:
             else:
                 self.set(path, k, str(v))
 
-    def _collect(self, path):
+    def _split(self, path):
         paths = path.strip("/").split("/")
         if paths[0] == self.base:
             paths = paths[1:]
+        return paths[:-1], paths[-1]
+
+    def _fetch(self, path):
+        levels, key = self._split(path)
+        if key == SERVICE_DOCUMENT:
+            return self._document_data("/".join(levels))
+        return self.get("/".join(levels), key)
+
+    def _collect(self, path, value):
+        levels, key = self._split(path)
         data = self.data
-        for key in paths[:-1]:
-            data.setdefault(key, {})
-            data = data[key]
-        _path = "/".join(paths[:-1])
-        key = paths[-1]
-        data[key] = self.get(_path, key)
+        for level in levels:
+            data.setdefault(level, {})
+            data = data[level]
+        if key == SERVICE_DOCUMENT:
+            data.update(value)
+        else:
+            data[key] = value
 
     def dump(self, path):
         self.data = {}
-        self._walk_tree(path, self._collect)
+        for paths in self._tree_levels(path):
+            for _path, value in zip(paths, self.map(self._fetch, paths)):
+                self._collect(_path, value)
         for _path in path.strip("/").split("/"):
             if _path != "":
                 self.data = self.data[_path]
@@ -0,0 +1,8 @@
+# bench - time backend operations against synthetic stores
+
+bench_options ?= --services 100 --depth 2 --keys 10
+bench_output ?= benchmarks.json
+
+# run the benchmark suite;  example: make bench_options="-b file --services 1000" bench
+bench:
+	python -m benchmarks $(bench_options) -O $(bench_output)
@@ -1,7 +1,7 @@
 # source formatting
 
 
-lint_src = $(module) tests docs
+lint_src = $(module) tests benchmarks docs
 
 _fmt:
 	isort $(lint_src)
@@ -1,20 +1,70 @@
 import json
 import logging
+import os
 
 import pytest
 
-from local_chamber import VaultSecrets
+from benchmarks.fakevault import FakeVault
+from local_chamber import SqliteChamber, VaultSecrets
 
 logging.getLogger("urllib3.connectionpool").setLevel("WARNING")
 
 
+@pytest.fixture(scope="session", autouse=True)
+def vault_server():
+    """yield an in-process fake vault when VAULT_ADDR does not name a live one, else None"""
+    if os.environ.get("VAULT_ADDR"):
+        yield None
+        return
+    with FakeVault() as vault:
+        os.environ["VAULT_ADDR"] = vault.url
+        os.environ.setdefault("VAULT_TOKEN", "fake-vault-token")
+        try:
+            yield vault
+        finally:
+            del os.environ["VAULT_ADDR"]
+
+
+@pytest.fixture
+def fake_vault(vault_server):
+    """the fake vault with its counters zeroed and no latency; skip when testing against a live vault"""
+    if vault_server is None:
+        pytest.skip("requires the in-process fake vault; unset VAULT_ADDR")
+    vault_server.latency = 0.0
+    vault_server.reset()
+    yield vault_server
+    vault_server.latency = 0.0
+
+
+def _services(secrets, path=()):
+    """yield (service, secrets) for each level of a nested secrets dict holding values"""
+    values = {k: v for k, v in secrets.items() if not isinstance(v, dict)}
+    if values:
+        yield "/".join(path), values
+    for k, v in secrets.items():
+        if isinstance(v, dict):
+            yield from _services(v, path + (k,))
+
+
+@pytest.fixture(autouse=True)
+def sqlite_db(shared_datadir):
+    """load the secrets.json fixture into a sqlite backend database"""
+    db_file = shared_datadir / "secrets.db"
+    config = {"dir": shared_datadir / "secrets", "sqlite": db_file}
+    with SqliteChamber(config=config, debug=True, echo=print, require_exists=True) as chamber:
+        for service, secrets in _services(json.loads((shared_datadir / "secrets.json").read_text())):
+            chamber.write_service(service, secrets)
+    return db_file
+
+
 @pytest.fixture(autouse=True)
-def env_secrets_dir(monkeypatch, shared_datadir):
+def env_secrets_dir(monkeypatch, shared_datadir, sqlite_db):
     secrets_dir = shared_datadir / "secrets"
     secrets_file = shared_datadir / "secrets.json"
     with monkeypatch.context() as m:
         m.setenv("SECRETS_DIR", str(secrets_dir))
         m.setenv("SECRETS_FILE", str(secrets_file))
+        m.setenv("SECRETS_SQLITE_FILE", str(sqlite_db))
         yield m
 
 
@@ -0,0 +1,163 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import pytest
+from click.testing import CliRunner
+
+from local_chamber import ChamberError, cli
+from local_chamber.agent import Agent, AgentClient, _peer_uid
+from local_chamber.chamber import (
+    EnvdirChamber,
+    FileChamber,
+    SqliteChamber,
+    VaultChamber,
+)
+
+logger = logging.getLogger()
+logger.setLevel("INFO")
+info = logger.info
+
+
+@pytest.fixture
+def config(shared_datadir, sqlite_db):
+    return {"dir": shared_datadir / "secrets", "file": shared_datadir / "secrets.json", "sqlite": sqlite_db}
+
+
+@pytest.fixture
+def socket_path():
+    # unix socket paths are limited to ~100 bytes, so avoid the long pytest data directory
+    with tempfile.TemporaryDirectory(prefix="lc-agent-") as tmpdir:
+        yield Path(tmpdir) / "agent" / "test.sock"
+
+
+@pytest.fixture(params=[EnvdirChamber, FileChamber, VaultChamber, SqliteChamber])
+def agent(request, config, socket_path):
+    agent = Agent(request.param(config=config, debug=True, echo=info, require_exists=True), socket_path, echo=info)
+    thread = threading.Thread(target=agent.run, daemon=True)
+    thread.start()
+    for _ in range(500):
+        if socket_path.is_socket():
+            break
+        time.sleep(0.01)
+    yield agent
+    agent.stop()
+    thread.join(5)
+    assert not socket_path.exists()
+
+
+@pytest.fixture
+def client(agent, config):
+    with AgentClient.connect(agent.socket_path, type(agent.chamber), config=config, debug=True, echo=info, require_exists=True) as c:
+        yield c
+
+
+def test_agent_socket_permissions(agent):
+    assert agent.socket_path.stat().st_mode & 0o777 == 0o600
+    assert agent.socket_path.parent.stat().st_mode & 0o777 == 0o700
+
+
+def test_agent_read_secrets(agent, client):
+    assert client._call("ping")["pid"]
+    assert _peer_uid(client.sock) in (None, os.getuid())
+    with type(agent.chamber)(config=agent.chamber.config, debug=True, echo=info, require_exists=True) as chamber:
+        assert client._secrets("testservice") == chamber._secrets("testservice")
+        assert sorted(client._list_services()) == sorted(chamber._list_services())
+    value = client._read("testservice", "key1")[0]
+    assert value == "value1"
+
+
+def test_agent_errors(client):
+    with pytest.raises(ChamberError, match="service not found"):
+        client.env("nonexistent_testservice")
+    with pytest.raises(ChamberError, match="read-only"):
+        client.write("testservice", "key1", "changed")
+
+
+def test_agent_sees_changes(agent, client):
+    assert client._secrets("testservice")["key1"] == "value1"
+    with type(agent.chamber)(config=agent.chamber.config, debug=True, echo=info, require_exists=True) as chamber:
+        chamber.write("testservice", "key1", "changed")
+    assert client._secrets("testservice")["key1"] == "changed"
+
+
+BACKEND_NAMES = {EnvdirChamber: "envdir", FileChamber: "file", VaultChamber: "vault", SqliteChamber: "sqlite"}
+
+
+def test_agent_cli(agent, config):
+    backend = BACKEND_NAMES[type(agent.chamber)]
+    args = ["-b", backend, "--agent", "--agent-socket", str(agent.socket_path)]
+    runner = CliRunner()
+    served = runner.invoke(cli, args + ["export", "testservice"], catch_exceptions=False)
+    direct = runner.invoke(cli, args + ["--no-agent", "export", "testservice"], catch_exceptions=False)
+    assert served.exit_code == direct.exit_code == 0
+    assert json.loads(served.output) == json.loads(direct.output)
+
+    result = runner.invoke(cli, args + ["read", "-q", "testservice", "key1"], catch_exceptions=False)
+    assert result.output == "value1\n"
+
+
+def test_agent_cli_fallback(socket_path):
+    # with no agent listening, commands run against the backend directly
+    result = CliRunner().invoke(
+        cli,
+        ["-b", "envdir", "--agent", "--agent-socket", str(socket_path), "read", "-q", "testservice", "key1"],
+        catch_exceptions=False,
+    )
+    assert result.output == "value1\n"
+
+
+def test_agent_other_store(agent, config, shared_datadir, tmp_path):
+    # a client configured for another store, or another backend, bypasses the agent
+    other = {"dir": tmp_path / "secrets", "file": tmp_path / "secrets.json", "sqlite": tmp_path / "secrets.db", "root": "other"}
+    other_backend = FileChamber if type(agent.chamber) is EnvdirChamber else EnvdirChamber
+    for backend, store in [(type(agent.chamber), other), (other_backend, config)]:
+        assert AgentClient.connect(agent.socket_path, backend, config=store, debug=True, echo=info, require_exists=True) is None
+
+    (tmp_path / "secrets" / "testservice").mkdir(parents=True)
+    (tmp_path / "secrets" / "testservice" / "key1").write_text("other")
+    (tmp_path / "secrets.json").write_text(json.dumps({"testservice": {"key1": "other"}}))
+    with SqliteChamber(config=other, debug=True, echo=info, require_exists=True) as chamber:
+        chamber.write("testservice", "key1", "other")
+    with VaultChamber(config=other, debug=True, echo=info, require_exists=True) as chamber:
+        chamber.write("testservice", "key1", "other")
+
+    backend = BACKEND_NAMES[type(agent.chamber)]
+    args = ["-b", backend, "--agent", "--agent-socket", str(agent.socket_path), "-s", str(other["dir"]), "-f", str(other["file"])]
+    args += ["--sqlite-file", str(other["sqlite"]), "--root", "other", "read", "-q", "testservice", "key1"]
+    result = CliRunner().invoke(cli, args, catch_exceptions=False)
+    assert result.output == "other\n"
+
+
+def test_agent_untrusted_socket_dir(agent, config):
+    # a socket in a directory other users can enter is not trusted by clients
+    agent.socket_path.parent.chmod(0o755)
+    try:
+        kwargs = dict(config=config, debug=True, echo=info, require_exists=True)
+        assert AgentClient.connect(agent.socket_path, type(agent.chamber), **kwargs) is None
+    finally:
+        agent.socket_path.parent.chmod(0o700)
+
+
+def test_agent_refuses_shared_dir(config, socket_path):
+    socket_path.parent.mkdir(mode=0o755)
+    socket_path.parent.chmod(0o755)
+    agent = Agent(EnvdirChamber(config=config, debug=True, echo=info, require_exists=True), socket_path, echo=info)
+    with pytest.raises(ChamberError, match="mode 0700"):
+        agent.run()
+    assert not socket_path.exists()
+
+
+def test_agent_cli_off_by_default(monkeypatch, socket_path):
+    def connect(*args, **kwargs):
+        raise AssertionError("connected to an agent without --agent")
+
+    monkeypatch.setattr(AgentClient, "connect", connect)
+    result = CliRunner().invoke(
+        cli, ["-b", "envdir", "--agent-socket", str(socket_path), "read", "-q", "testservice", "key1"], catch_exceptions=False
+    )
+    assert result.output == "value1\n"
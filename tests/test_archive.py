@@ -1,11 +1,21 @@
+import json
 import logging
+import tarfile
 import tempfile
 from pathlib import Path
+from uuid import uuid4
 
 import pytest
 
-from local_chamber.archive import Backup, Restore
-from local_chamber.chamber import VaultChamber
+from local_chamber import ChamberError
+from local_chamber.archive import Backup, Restore, read_manifest
+from local_chamber.chamber import (
+    EnvdirChamber,
+    FileChamber,
+    SqliteChamber,
+    VaultChamber,
+)
+from local_chamber.constants import COMPRESSION_SUFFIXES
 
 logger = logging.getLogger()
 logger.setLevel("INFO")
@@ -13,8 +23,8 @@ info = logger.info
 
 
 @pytest.fixture
-def config(shared_datadir):
-    return {"dir": shared_datadir / "secrets", "file": shared_datadir / "secrets.json"}
+def config(shared_datadir, sqlite_db):
+    return {"dir": shared_datadir / "secrets", "file": shared_datadir / "secrets.json", "sqlite": sqlite_db}
 
 
 @pytest.fixture
@@ -78,3 +88,112 @@ def test_backup_restore(chamber, shared_datadir):
         restored[service] = chamber._secrets(service)
 
     assert restored == reference
+
+
+@pytest.mark.parametrize("chamber_class", [EnvdirChamber, FileChamber, VaultChamber, SqliteChamber])
+def test_backup_restore_bulk(chamber_class, config, shared_datadir):
+    with chamber_class(config=config, debug=True, echo=info, require_exists=True) as chamber:
+        reference = {service: chamber._secrets(service) for service in chamber._list_services()}
+        tarball = Path(Backup(chamber=chamber, output_path=shared_datadir, file_name=None).write())
+
+    with chamber_class(config=config, debug=True, echo=info, require_exists=True) as chamber:
+        chamber.write("testservice", "key1", "changed")
+        chamber.write("restore_extra/sub", "key", "removed by restore")
+
+    with chamber_class(config=config, debug=True, echo=info, require_exists=True) as chamber:
+
+        def _verify_key(*args, **kwargs):
+            raise AssertionError("bulk restore should not verify keys one at a time")
+
+        chamber._verify_key = _verify_key
+        result = Restore(chamber=chamber, tarball=tarball, patch=False, echo=info).read()
+        assert result.startswith(f"Restored {len(reference)} services")
+
+    with chamber_class(config=config, debug=True, echo=info, require_exists=True) as chamber:
+        restored = {service: chamber._secrets(service) for service in chamber._list_services()}
+    assert restored == reference
+
+
+@pytest.mark.parametrize("chamber_class", [EnvdirChamber, FileChamber, VaultChamber, SqliteChamber])
+def test_backup_jobs_member_order(chamber_class, config, shared_datadir):
+    tarballs = {}
+    for jobs in [1, 4]:
+        with chamber_class(config=config, debug=True, echo=info, require_exists=True) as chamber:
+            backup = Backup(chamber=chamber, output_path=shared_datadir, file_name=f"jobs{jobs}.tgz", jobs=jobs)
+            backup.write()
+            services = [service for service, _ in chamber._walk()]
+        assert backup.service_count == len(services)
+        assert f"Exported {len(services)} services" in backup.summary()
+        with tarfile.open(shared_datadir / f"jobs{jobs}.tgz") as tb:
+            members = [m.name for m in tb.getmembers() if m.isfile() and not Path(m.name).name.startswith("__")]
+            tarballs[jobs] = [(Path(m).name, tb.extractfile(m).read()) for m in members]
+        assert [Path(m).stem for m in members] == [service.replace("/", ".") for service in services]
+    assert tarballs[1] == tarballs[4]
+
+
+@pytest.mark.parametrize("chamber_class", [EnvdirChamber, FileChamber, VaultChamber, SqliteChamber])
+def test_backup_incremental_chain(chamber_class, config, shared_datadir):
+    def _snapshot():
+        with chamber_class(config=config, debug=True, echo=info, require_exists=True) as chamber:
+            return {service: chamber._secrets(service) for service in chamber._list_services()}
+
+    def _backup(name, base=None):
+        with chamber_class(config=config, debug=True, echo=info, require_exists=True) as chamber:
+            manifest = None if base is None else read_manifest(base)
+            backup = Backup(chamber=chamber, output_path=shared_datadir, file_name=name, base_manifest=manifest)
+            return Path(backup.write()), backup
+
+    full, backup = _backup("full.tgz")
+    assert backup.manifest["base"] is None
+    assert read_manifest(full) == json.loads((shared_datadir / "full.manifest.json").read_text())
+
+    removed = sorted(service for service in backup.manifest["services"] if service != "testservice")[-1]
+    with chamber_class(config=config, debug=True, echo=info, require_exists=True) as chamber:
+        chamber.write("testservice", "key1", "changed")
+        chamber.write(f"incremental/{uuid4().hex}", "key", "added")
+    inc1, backup = _backup("inc1.tgz", full)
+    assert backup.service_count == 2
+    assert backup.skipped_count == len(backup.manifest["services"]) - 2
+
+    with chamber_class(config=config, debug=True, echo=info, require_exists=True) as chamber:
+        chamber.delete("testservice", "key1")
+        for key in chamber._secrets(removed):
+            chamber.delete(removed, key)
+    inc2, backup = _backup("inc2.tgz", shared_datadir / "inc1.manifest.json")
+    assert backup.manifest["removed"] == [removed]
+    with tarfile.open(inc2) as tb:
+        assert len([m for m in tb.getmembers() if m.isfile()]) == 3
+    reference = _snapshot()
+
+    with chamber_class(config=config, debug=True, echo=info, require_exists=True) as chamber:
+        with pytest.raises(ChamberError):
+            Restore(chamber=chamber, tarball=full, patch=False, echo=info, increments=[inc2]).read()
+        with pytest.raises(ChamberError):
+            Restore(chamber=chamber, tarball=inc1, patch=False, echo=info).read()
+        Restore(chamber=chamber, tarball=full, patch=False, echo=info, increments=[inc1, inc2]).read()
+    assert _snapshot() == reference
+
+
+@pytest.mark.parametrize(
+    "compression, level, magic",
+    [("gz", 1, b"\x1f\x8b"), ("bz2", None, b"BZh"), ("xz", 0, b"\xfd7zXZ"), ("none", None, b"")],
+)
+def test_backup_compression(compression, level, magic, config, shared_datadir):
+    with EnvdirChamber(config=config, debug=True, echo=info, require_exists=True) as chamber:
+        reference = {service: chamber._secrets(service) for service in chamber._list_services()}
+        backup = Backup(chamber=chamber, output_path=shared_datadir, file_name=None, compression=compression, level=level)
+        tarball = Path(backup.write())
+    assert tarball.suffix == COMPRESSION_SUFFIXES[compression]
+    assert tarball.read_bytes().startswith(magic)
+    assert tarfile.is_tarfile(tarball)
+    assert read_manifest(tarball)["services"].keys() == reference.keys()
+
+    with EnvdirChamber(config=config, debug=True, echo=info, require_exists=True) as chamber:
+        Restore(chamber=chamber, tarball=tarball, patch=False, echo=info).read()
+        assert {service: chamber._secrets(service) for service in chamber._list_services()} == reference
+
+
+def test_backup_compression_invalid_level(config, shared_datadir):
+    with EnvdirChamber(config=config, debug=True, echo=info, require_exists=True) as chamber:
+        with pytest.raises(ChamberError):
+            Backup(chamber=chamber, output_path=shared_datadir, file_name=None, compression="bz2", level=0)
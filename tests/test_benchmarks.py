@@ -0,0 +1,32 @@
+import json
+
+import pytest
+from click.testing import CliRunner
+
+from benchmarks.__main__ import benchmarks
+from benchmarks.store import StoreShape, generate_store, service_names
+from benchmarks.suite import OPERATIONS
+
+
+def test_benchmarks_store_shape():
+    shape = StoreShape(services=3, depth=3, keys=4, value_size=16)
+    assert service_names(shape)[:3] == ["svc0000", "svc0000/sub1", "svc0000/sub1/sub2"]
+    store = generate_store(shape)
+    assert len(store) == shape.total_services == 9
+    assert sum(len(secrets) for secrets in store.values()) == shape.total_secrets
+    assert all(len(value) == 16 for secrets in store.values() for value in secrets.values())
+    assert generate_store(shape) == store
+
+
+@pytest.mark.parametrize("backend", ["envdir", "file", "vault", "sqlite"])
+def test_benchmarks_smoke(backend, tmp_path):
+    output = tmp_path / "results.json"
+    args = ["-b", backend, "--services", "3", "--keys", "2", "-r", "1", "-O", str(output), "--fake-vault-latency", "0"]
+    result = CliRunner().invoke(benchmarks, args, catch_exceptions=False)
+    assert result.exit_code == 0
+    report = json.loads(output.read_text())
+    assert report["shape"]["total_secrets"] == 12
+    operations = report["results"][backend]["operations"]
+    assert set(operations) == set(OPERATIONS)
+    if backend == "vault":
+        assert operations["read"]["requests"] == {"LIST metadata": 1, "GET data": 1}
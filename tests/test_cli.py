@@ -6,15 +6,19 @@
 import json
 import os
 import pdb
+import pstats
 import sys
+import time
 from logging import getLogger
-from subprocess import check_output
+from pathlib import Path
+from subprocess import check_output, run
 from uuid import uuid4
 
 import click
 import pytest
 from click.testing import Result
 
+import local_chamber
 from local_chamber import ChamberError, __version__, cli
 from local_chamber.cli import SysArgs
 
@@ -310,3 +314,98 @@ def test_cli_backend_env(runner, shared_datadir):
     assert services[0] == "Service"
     services.pop(0)
     assert set(services) == set(["service1", "service2"])
+
+
+@pytest.mark.parametrize("backend", ["envdir", "file"])
+def test_cli_local_backend_skips_heavy_imports(backend):
+    script = "\n".join(
+        [
+            "import sys",
+            "from local_chamber.cli import cli",
+            f"cli(['--backend', '{backend}', 'read', 'testservice', 'key1'], standalone_mode=False)",
+            "print('loaded:', *[m for m in ['hvac', 'requests', 'yaml', 'tarfile'] if m in sys.modules])",
+        ]
+    )
+    package_root = Path(local_chamber.__file__).parent.parent
+    output = check_output([sys.executable, "-c", script], text=True, cwd=package_root)
+    lines = output.strip().split("\n")
+    assert lines[1].split()[:2] == ["key1", "value1"]
+    assert lines[-1] == "loaded:"
+
+
+def test_cli_backup_restore_pipe(runner, shared_datadir):
+    result = runner(["-b", "envdir", "backup", "-"])
+    tarball = result.stdout_bytes
+    assert tarball[:2] == b"\x1f\x8b"
+    assert not list(shared_datadir.glob("*.tgz"))
+
+    runner(["-b", "envdir", "write", "testservice", "key1", "changed"])
+    result = runner(["-b", "envdir", "restore", "--force", "-"], input=tarball)
+    assert "Restored 3 services from stdin" in result.output
+    result = runner(["-b", "envdir", "read", "-q", "testservice", "key1"])
+    assert result.output == "value1\n"
+
+
+def test_cli_cache_stats_clear(runner, shared_datadir):
+    cache_dir = shared_datadir / "vault_cache"
+    cache_dir.mkdir()
+    (cache_dir / "0123.entry").write_bytes(b"token")
+    result = runner(["--vault-cache-dir", str(cache_dir), "cache", "stats"])
+    assert "entries\t1" in result.output.splitlines()
+    result = runner(["--vault-cache-dir", str(cache_dir), "cache", "clear"])
+    assert result.output == "Deleted 1 cache entries.\n"
+    assert list(cache_dir.iterdir()) == []
+
+
+@pytest.mark.parametrize("backend", ["envdir", "file"])
+def test_cli_timings(backend):
+    package_root = Path(local_chamber.__file__).parent.parent
+    cmd = [sys.executable, "-m", "local_chamber", "--backend", backend, "--timings", "list", "testservice"]
+    proc = run(cmd, capture_output=True, text=True, cwd=package_root, check=True)
+    assert proc.stdout.startswith("Key")
+    timings = json.loads(proc.stderr)
+    assert list(timings["phases"]) == ["import", "setup", "command"]
+    assert timings["operations"]["list"]["count"] == 1
+    assert timings["operations"]["output"]["count"] == 6
+    assert timings["counters"]["files_stated"] >= 1
+
+    cmd = [sys.executable, "-m", "local_chamber", "--backend", backend, "--timings", "list-services", "-s"]
+    proc = run(cmd, capture_output=True, text=True, cwd=package_root, check=True)
+    walk = json.loads(proc.stderr)["operations"]["walk"]
+    assert walk["count"] == 1
+    assert walk["total"] > 0
+
+
+def test_timings_generator_excludes_consumer():
+    from local_chamber.timings import Timings
+
+    def produce():
+        yield 1
+        time.sleep(0.01)
+        yield 2
+
+    timings = Timings()
+    for _ in timings.timed_iter("walk", produce)():
+        time.sleep(0.05)
+    assert 0.01 <= timings.samples["walk"][0] < 0.05
+
+
+def test_cli_profile(runner, shared_datadir):
+    profile = shared_datadir / "profile" / "export.pstats"
+    exported = shared_datadir / "export.json"
+    runner(["-b", "envdir", "--profile", str(profile), "--profile-top", "5", "export", "-o", str(exported), "--tree", "testservice"])
+    assert json.loads(exported.read_text())["key1"] == "value1"
+    stats = pstats.Stats(str(profile))
+    assert any(function == "export" for _, _, function in stats.stats)
+    report = (shared_datadir / "profile" / "export.pstats.allocations.txt").read_text().splitlines()
+    assert report[0].startswith("traced memory: current ")
+    assert len([line for line in report if line[:4].strip().rstrip(".").isdigit()]) == 5
+
+
+def test_cli_sqlite_write_persists(runner, sqlite_db):
+    runner(["-b", "sqlite", "write", "testservice", "newkey", "newvalue"])
+    runner(["-b", "sqlite", "delete", "testservice", "key1"])
+    result = runner(["-b", "sqlite", "--no-agent", "read", "-q", "testservice", "newkey"])
+    assert result.output == "newvalue\n"
+    result = runner(["-b", "sqlite", "--no-agent", "list", "testservice"])
+    assert "key1" not in result.output.split()
@@ -3,6 +3,7 @@
 """Tests for `local_chamber` package."""
 
 import json
+import os
 import sys
 from pprint import pprint
 from subprocess import check_output, run
@@ -11,7 +12,15 @@ import pytest
 import yaml
 from yaml import Loader
 
-from local_chamber import ChamberError, EnvdirChamber, FileChamber, VaultChamber
+from local_chamber import (
+    ChamberError,
+    EnvdirChamber,
+    FileChamber,
+    SqliteChamber,
+    VaultChamber,
+    VaultSecrets,
+)
+from local_chamber.chamber import _owner_name
 
 DEBUG = False
 
@@ -31,8 +40,8 @@ def secrets_file(shared_datadir):
 
 
 @pytest.fixture
-def config(secrets, secrets_file):
-    return {"dir": secrets, "file": str(secrets_file)}
+def config(secrets, secrets_file, sqlite_db):
+    return {"dir": secrets, "file": str(secrets_file), "sqlite": sqlite_db}
 
 
 @pytest.fixture
@@ -60,7 +69,7 @@ def _list_keys(secrets, path=[]):
 
 
 @pytest.fixture
-def find(shared_datadir, testinit_export):
+def find(shared_datadir, testinit_export, sqlite_db):
     def _find(find_type, secrets_dir=shared_datadir / "secrets", secrets_file=shared_datadir / "secrets.json"):
         if find_type == "dir":
             output = check_output(["find", str(secrets_dir)])
@@ -68,6 +77,17 @@ def find(shared_datadir, testinit_export):
         elif find_type == "file":
             lines = _list_keys(json.loads(secrets_file.read_text()), [])
             lines = ["/secrets/" + line for line in lines]
+        elif find_type == "sqlite":
+            with SqliteChamber(
+                config={"dir": secrets_dir, "sqlite": sqlite_db}, debug=True, echo=_echo, require_exists=True
+            ) as chamber:
+                secrets = {}
+                for service, _ in chamber._walk():
+                    s = secrets
+                    for level in service.split("/"):
+                        s = s.setdefault(level, {})
+                    s.update(chamber._secrets(service))
+            lines = ["/secrets/" + line for line in _list_keys(secrets, [])]
         elif find_type == "vault":
             json_data = testinit_export(path="/").strip()
             lines = _list_keys(json.loads(json_data), [])
@@ -116,7 +136,7 @@ def errors():
     yield _errors
 
 
-@pytest.mark.parametrize("chamber_class", [EnvdirChamber, FileChamber, VaultChamber])
+@pytest.mark.parametrize("chamber_class", [EnvdirChamber, FileChamber, VaultChamber, SqliteChamber])
 def test_chamber_list_services(chamber_class, config, lines, capsys):
     with chamber_class(config=config, debug=True, echo=_echo, require_exists=True) as chamber:
         capsys.readouterr()
@@ -132,7 +152,7 @@ def test_chamber_list_services(chamber_class, config, lines, capsys):
         pprint(lines)
 
 
-@pytest.mark.parametrize("chamber_class", [EnvdirChamber, FileChamber, VaultChamber])
+@pytest.mark.parametrize("chamber_class", [EnvdirChamber, FileChamber, VaultChamber, SqliteChamber])
 def test_chamber_list_services_filtered(chamber_class, config, lines, capsys):
     with chamber_class(config=config, debug=True, echo=_echo, require_exists=True) as chamber:
         ret = chamber.list_services(service_filter="testservice/sub1")
@@ -142,7 +162,7 @@ def test_chamber_list_services_filtered(chamber_class, config, lines, capsys):
     pprint(lines)
 
 
-@pytest.mark.parametrize("chamber_class", [EnvdirChamber, FileChamber, VaultChamber])
+@pytest.mark.parametrize("chamber_class", [EnvdirChamber, FileChamber, VaultChamber, SqliteChamber])
 def test_chamber_list_services_and_secrets(chamber_class, config, lines, capsys):
     with chamber_class(config=config, debug=True, echo=_echo, require_exists=True) as chamber:
         ret = chamber.list_services(include_secrets=True)
@@ -164,7 +184,7 @@ def test_chamber_list_services_and_secrets(chamber_class, config, lines, capsys)
     assert lines == valid_lines
 
 
-@pytest.mark.parametrize("chamber_class", [EnvdirChamber, FileChamber, VaultChamber])
+@pytest.mark.parametrize("chamber_class", [EnvdirChamber, FileChamber, VaultChamber, SqliteChamber])
 def test_chamber_read(chamber_class, config, lines, capsys):
     with chamber_class(config=config, debug=True, echo=_echo, require_exists=True) as chamber:
         ret = chamber.read("testservice", "key1")
@@ -176,7 +196,7 @@ def test_chamber_read(chamber_class, config, lines, capsys):
     assert value == "value1"
 
 
-@pytest.mark.parametrize("chamber_class", [EnvdirChamber, FileChamber, VaultChamber])
+@pytest.mark.parametrize("chamber_class", [EnvdirChamber, FileChamber, VaultChamber, SqliteChamber])
 def test_chamber_readsubkey(chamber_class, config, lines, capsys):
     with chamber_class(config=config, debug=True, echo=_echo, require_exists=True) as chamber:
         ret = chamber.read("testservice/sub2", "key1")
@@ -188,7 +208,9 @@ def test_chamber_readsubkey(chamber_class, config, lines, capsys):
     assert value == "value21"
 
 
-@pytest.mark.parametrize("chamber_class, find_type", [(EnvdirChamber, "dir"), (FileChamber, "file"), (VaultChamber, "vault")])
+@pytest.mark.parametrize(
+    "chamber_class, find_type", [(EnvdirChamber, "dir"), (FileChamber, "file"), (VaultChamber, "vault"), (SqliteChamber, "sqlite")]
+)
 def test_chamber_write(chamber_class, config, find, find_type, lines, capsys):
     before = find(find_type)
     with chamber_class(config=config, debug=True, echo=_echo, require_exists=True) as chamber:
@@ -199,7 +221,9 @@ def test_chamber_write(chamber_class, config, find, find_type, lines, capsys):
     pprint(after)
 
 
-@pytest.mark.parametrize("chamber_class, find_type", [(EnvdirChamber, "dir"), (FileChamber, "file"), (VaultChamber, "vault")])
+@pytest.mark.parametrize(
+    "chamber_class, find_type", [(EnvdirChamber, "dir"), (FileChamber, "file"), (VaultChamber, "vault"), (SqliteChamber, "sqlite")]
+)
 def test_chamber_delete_exists(chamber_class, config, find, find_type, lines, capsys):
     before = find(find_type)
     with chamber_class(config=config, debug=True, echo=_echo, require_exists=True) as chamber:
@@ -209,7 +233,9 @@ def test_chamber_delete_exists(chamber_class, config, find, find_type, lines, ca
     assert before != after
 
 
-@pytest.mark.parametrize("chamber_class, find_type", [(VaultChamber, "vault"), (FileChamber, "file"), (EnvdirChamber, "dir")])
+@pytest.mark.parametrize(
+    "chamber_class, find_type", [(VaultChamber, "vault"), (FileChamber, "file"), (EnvdirChamber, "dir"), (SqliteChamber, "sqlite")]
+)
 def test_chamber_delete_clears_service(chamber_class, config, find, find_type, lines, capsys, shared_datadir):
     def find_service(service):
         for s in find(find_type):
@@ -237,7 +263,9 @@ def test_chamber_delete_clears_service(chamber_class, config, find, find_type, l
     assert not find_service(service)
 
 
-@pytest.mark.parametrize("chamber_class, find_type", [(EnvdirChamber, "dir"), (FileChamber, "file"), (VaultChamber, "vault")])
+@pytest.mark.parametrize(
+    "chamber_class, find_type", [(EnvdirChamber, "dir"), (FileChamber, "file"), (VaultChamber, "vault"), (SqliteChamber, "sqlite")]
+)
 def test_chamber_delete_notfound(chamber_class, config, find, find_type, lines, capsys):
     with chamber_class(config=config, debug=True, echo=_echo, require_exists=True) as chamber:
         with pytest.raises(ChamberError) as exc_info:
@@ -247,7 +275,9 @@ def test_chamber_delete_notfound(chamber_class, config, find, find_type, lines,
     assert exc_info.value.args[0] == "Error: secret not found: 'testservice/sir_not_appearing_in_this_film'"
 
 
-@pytest.mark.parametrize("chamber_class, find_type", [(EnvdirChamber, "dir"), (FileChamber, "file"), (VaultChamber, "vault")])
+@pytest.mark.parametrize(
+    "chamber_class, find_type", [(EnvdirChamber, "dir"), (FileChamber, "file"), (VaultChamber, "vault"), (SqliteChamber, "sqlite")]
+)
 def test_chamber_prune_exists(chamber_class, config, find, find_type, lines, capsys):
     before = find(find_type)
     with chamber_class(config=config, debug=True, echo=_echo, require_exists=True) as chamber:
@@ -257,7 +287,9 @@ def test_chamber_prune_exists(chamber_class, config, find, find_type, lines, cap
     assert before != after
 
 
-@pytest.mark.parametrize("chamber_class, find_type", [(EnvdirChamber, "dir"), (FileChamber, "file"), (VaultChamber, "vault")])
+@pytest.mark.parametrize(
+    "chamber_class, find_type", [(EnvdirChamber, "dir"), (FileChamber, "file"), (VaultChamber, "vault"), (SqliteChamber, "sqlite")]
+)
 def test_chamber_prune_notfound(chamber_class, config, find, find_type, lines, capsys):
     before = find(find_type)
     with chamber_class(config=config, debug=True, echo=_echo, require_exists=False) as chamber:
@@ -278,7 +310,7 @@ def testservice_env_lines():
     ]
 
 
-@pytest.mark.parametrize("chamber_class", [EnvdirChamber, FileChamber, VaultChamber])
+@pytest.mark.parametrize("chamber_class", [EnvdirChamber, FileChamber, VaultChamber, SqliteChamber])
 def test_chamber_env(chamber_class, config, lines, capsys, testservice_env_lines):
     with chamber_class(config=config, debug=True, echo=_echo, require_exists=True) as chamber:
         ret = chamber.env("testservice")
@@ -292,7 +324,7 @@ def verify_json(shared_datadir):
     return (shared_datadir / "test.json").read_text()
 
 
-@pytest.mark.parametrize("chamber_class", [EnvdirChamber, FileChamber, VaultChamber])
+@pytest.mark.parametrize("chamber_class", [EnvdirChamber, FileChamber, VaultChamber, SqliteChamber])
 def test_chamber_export_json(chamber_class, config, capsys, verify_json, output):
     with chamber_class(config=config, debug=True, echo=_echo, require_exists=True) as chamber:
         ret = chamber.export(fmt="json", compact_json=True, sort_keys=True, service="testservice", output_file=sys.stdout)
@@ -305,7 +337,7 @@ def verify_yaml(shared_datadir):
     return (shared_datadir / "test.yaml").read_text()
 
 
-@pytest.mark.parametrize("chamber_class", [EnvdirChamber, FileChamber, VaultChamber])
+@pytest.mark.parametrize("chamber_class", [EnvdirChamber, FileChamber, VaultChamber, SqliteChamber])
 def test_chamber_export_yaml(chamber_class, config, capsys, verify_yaml, output):
     with chamber_class(config=config, debug=True, echo=_echo, require_exists=True) as chamber:
         ret = chamber.export(fmt="yaml", service="testservice", output_file=sys.stdout)
@@ -320,7 +352,7 @@ def verify_csv(shared_datadir):
     return (shared_datadir / "test.csv").read_text()
 
 
-@pytest.mark.parametrize("chamber_class", [EnvdirChamber, FileChamber, VaultChamber])
+@pytest.mark.parametrize("chamber_class", [EnvdirChamber, FileChamber, VaultChamber, SqliteChamber])
 def test_chamber_export_csv(chamber_class, config, capsys, verify_csv, output):
     with chamber_class(config=config, debug=True, echo=_echo, require_exists=True) as chamber:
         ret = chamber.export(fmt="csv", service="testservice", output_file=sys.stdout)
@@ -334,7 +366,7 @@ def verify_tsv(shared_datadir):
     return (shared_datadir / "test.tsv").read_text()
 
 
-@pytest.mark.parametrize("chamber_class", [EnvdirChamber, FileChamber, VaultChamber])
+@pytest.mark.parametrize("chamber_class", [EnvdirChamber, FileChamber, VaultChamber, SqliteChamber])
 def test_chamber_export_tsv(chamber_class, config, capsys, verify_tsv, output):
     with chamber_class(config=config, debug=True, echo=_echo, require_exists=True) as chamber:
         ret = chamber.export(fmt="tsv", service="testservice", output_file=sys.stdout)
@@ -348,7 +380,7 @@ def verify_dotenv(shared_datadir):
     return (shared_datadir / "test.dotenv").read_text()
 
 
-@pytest.mark.parametrize("chamber_class", [EnvdirChamber, FileChamber, VaultChamber])
+@pytest.mark.parametrize("chamber_class", [EnvdirChamber, FileChamber, VaultChamber, SqliteChamber])
 def test_chamber_export_dotenv(chamber_class, config, capsys, verify_dotenv, output):
     with chamber_class(config=config, debug=True, echo=_echo, require_exists=True) as chamber:
         ret = chamber.export(fmt="dotenv", service="testservice", output_file=sys.stdout)
@@ -362,7 +394,7 @@ def verify_tfvars(shared_datadir):
     return (shared_datadir / "test.tfvars").read_text()
 
 
-@pytest.mark.parametrize("chamber_class", [EnvdirChamber, FileChamber, VaultChamber])
+@pytest.mark.parametrize("chamber_class", [EnvdirChamber, FileChamber, VaultChamber, SqliteChamber])
 def test_chamber_export_tfvars(chamber_class, config, capsys, verify_tfvars, output):
     with chamber_class(config=config, debug=True, echo=_echo, require_exists=True) as chamber:
         ret = chamber.export(fmt="tfvars", service="testservice", output_file=sys.stdout)
@@ -371,7 +403,7 @@ def test_chamber_export_tfvars(chamber_class, config, capsys, verify_tfvars, out
     assert output_tfvars == verify_tfvars
 
 
-@pytest.mark.parametrize("chamber_class", [EnvdirChamber, FileChamber, VaultChamber])
+@pytest.mark.parametrize("chamber_class", [EnvdirChamber, FileChamber, VaultChamber, SqliteChamber])
 def test_chamber_list_keys(chamber_class, config, capsys, lines):
     with chamber_class(config=config, debug=True, echo=_echo, require_exists=True) as chamber:
         ret = chamber.list("testservice/sub2")
@@ -396,7 +428,9 @@ def new_service_lines():
     ]
 
 
-@pytest.mark.parametrize("chamber_class, find_type", [(EnvdirChamber, "dir"), (FileChamber, "file"), (VaultChamber, "vault")])
+@pytest.mark.parametrize(
+    "chamber_class, find_type", [(EnvdirChamber, "dir"), (FileChamber, "file"), (VaultChamber, "vault"), (SqliteChamber, "sqlite")]
+)
 def test_chamber_import(chamber_class, config, find, find_type, json_file, new_service_lines):
     before = find(find_type)
     with chamber_class(config=config, debug=True, echo=_echo, require_exists=True) as chamber:
@@ -417,7 +451,7 @@ def valid_found_lines():
     return ["Service", "testservice", "testservice/sub1", "testservice/sub2"]
 
 
-@pytest.mark.parametrize("chamber_class", [EnvdirChamber, FileChamber, VaultChamber])
+@pytest.mark.parametrize("chamber_class", [EnvdirChamber, FileChamber, VaultChamber, SqliteChamber])
 def test_chamber_find(chamber_class, config, lines, capsys, valid_found_lines):
     with chamber_class(config=config, debug=True, echo=_echo, require_exists=True) as chamber:
         ret = chamber.find(by_value=False, key="key1")
@@ -426,7 +460,7 @@ def test_chamber_find(chamber_class, config, lines, capsys, valid_found_lines):
     assert out_lines == valid_found_lines
 
 
-@pytest.mark.parametrize("chamber_class", [EnvdirChamber, FileChamber, VaultChamber])
+@pytest.mark.parametrize("chamber_class", [EnvdirChamber, FileChamber, VaultChamber, SqliteChamber])
 def test_chamber_exec(chamber_class, config, lines, capfd, testservice_json):
     before_cmd = ["env"]
     capfd.readouterr()
@@ -456,7 +490,7 @@ def test_chamber_exec(chamber_class, config, lines, capfd, testservice_json):
     assert diff_dict == verify_testservice
 
 
-@pytest.mark.parametrize("chamber_class", [EnvdirChamber, FileChamber, VaultChamber])
+@pytest.mark.parametrize("chamber_class", [EnvdirChamber, FileChamber, VaultChamber, SqliteChamber])
 def test_chamber_exec_bad_command(chamber_class, config):
     with chamber_class(config=config, debug=True, echo=_echo, require_exists=True) as chamber:
         _cmd = ["nonexistent_command"]
@@ -465,7 +499,7 @@ def test_chamber_exec_bad_command(chamber_class, config):
         print(f"Exception: {exc_info}")
 
 
-@pytest.mark.parametrize("chamber_class", [EnvdirChamber, FileChamber, VaultChamber])
+@pytest.mark.parametrize("chamber_class", [EnvdirChamber, FileChamber, VaultChamber, SqliteChamber])
 def test_chamber_exec_nonexistent_service(chamber_class, config):
     with chamber_class(config=config, debug=True, echo=_echo, require_exists=True) as chamber:
         _cmd = ["bash", "-c", "env"]
@@ -474,7 +508,7 @@ def test_chamber_exec_nonexistent_service(chamber_class, config):
         print(f"Exception: {exc_info}")
 
 
-@pytest.mark.parametrize("chamber_class", [EnvdirChamber, FileChamber, VaultChamber])
+@pytest.mark.parametrize("chamber_class", [EnvdirChamber, FileChamber, VaultChamber, SqliteChamber])
 def test_chamber_exec_error_command(chamber_class, config, capfd):
     with chamber_class(config=config, debug=True, echo=_echo, require_exists=True) as chamber:
         _cmd = ["bash", "-c", "ls --nonexistent_option"]
@@ -483,3 +517,456 @@ def test_chamber_exec_error_command(chamber_class, config, capfd):
     out = capfd.readouterr()
     assert out.err
     print(f"stderr: {out.err}")
+
+
+@pytest.mark.parametrize("chamber_class", [EnvdirChamber, FileChamber, VaultChamber, SqliteChamber])
+def test_chamber_read_uses_service_index(chamber_class, config, lines, capsys, monkeypatch):
+    def _list_services(*args, **kwargs):
+        raise AssertionError("unexpected full service scan")
+
+    with chamber_class(config=config, debug=True, echo=_echo, require_exists=True) as chamber:
+        monkeypatch.setattr(chamber, "_list_services", _list_services)
+        assert chamber.read("testservice", "key1", quiet=True) == 0
+        with pytest.raises(ChamberError):
+            chamber.read("testservice", "index_key")
+        assert chamber.write("testservice", "index_key", "index_value") == 0
+        assert chamber.read("testservice", "index_key", quiet=True) == 0
+    assert lines(capsys) == ["value1", "index_value"]
+
+
+@pytest.mark.parametrize("chamber_class", [EnvdirChamber, FileChamber, VaultChamber, SqliteChamber])
+def test_chamber_secrets_read_once(chamber_class, config, capsys, monkeypatch):
+    reads = []
+    with chamber_class(config=config, debug=True, echo=_echo, require_exists=True) as chamber:
+        _secrets = chamber._secrets
+        monkeypatch.setattr(chamber, "_secrets", lambda service: reads.append(service) or _secrets(service))
+
+        chamber.list_services(include_secrets=True)
+        chamber.list("testservice")
+        assert reads == []
+
+        for _ in range(2):
+            chamber.export(output_file=sys.stdout, fmt="json", service="testservice", tree=True)
+            chamber.env("testservice")
+        assert sorted(reads) == sorted(set(reads))
+
+        chamber.write("testservice", "key1", "cache_value")
+        chamber.env("testservice")
+        assert reads.count("testservice") == 2
+        assert "export KEY1=cache_value" in capsys.readouterr().out
+
+        reads.clear()
+        chamber.prune("testservice/sub1")
+        assert reads == []
+
+
+@pytest.mark.parametrize(
+    "patterns, by_value, regex, glob, expected",
+    [
+        ("key2", False, False, False, ["testservice/sub1", "testservice/sub2"]),
+        (["fookey", "testkey"], False, False, False, ["testservice"]),
+        ("key.", False, False, False, ["testservice", "testservice/sub1", "testservice/sub2"]),
+        ("key[2-9]+", False, False, False, ["testservice/sub1", "testservice/sub2"]),
+        ("key", False, False, False, []),
+        ("key?", False, False, True, ["testservice", "testservice/sub1", "testservice/sub2"]),
+        ("key.", False, False, True, []),
+        ("k.y2", False, True, False, ["testservice/sub1\tkey2", "testservice/sub2\tkey2"]),
+        ("foo", True, False, False, ["testservice\tdynakey", "testservice\tfookey"]),
+        ("value1.", True, False, False, ["testservice/sub1\tkey1", "testservice/sub1\tkey2"]),
+        (
+            ["value1*", "howdy"],
+            True,
+            False,
+            True,
+            ["testservice\tkey1", "testservice\ttestkey", "testservice/sub1\tkey1", "testservice/sub1\tkey2"],
+        ),
+        ("value2", True, True, False, ["testservice/sub2\tkey1", "testservice/sub2\tkey2"]),
+    ],
+)
+@pytest.mark.parametrize("chamber_class", [EnvdirChamber, FileChamber, VaultChamber, SqliteChamber])
+def test_chamber_find_patterns(chamber_class, patterns, by_value, regex, glob, expected, config, lines, capsys):
+    for jobs in [1, 4]:
+        with chamber_class(config=config, debug=True, echo=_echo, require_exists=True) as chamber:
+            capsys.readouterr()
+            assert chamber.find(patterns, by_value, regex, jobs, glob) == 0
+        output = lines(capsys)
+        assert output[0] == ("Service\tKey" if by_value or regex else "Service")
+        assert [line for line in output[1:] if line.startswith("testservice")] == expected
+
+
+@pytest.mark.parametrize("chamber_class", [EnvdirChamber, FileChamber, VaultChamber, SqliteChamber])
+def test_chamber_find_sorted(chamber_class, config, lines, capsys):
+    with chamber_class(config=config, debug=True, echo=_echo, require_exists=True) as chamber:
+        for service in ["order/b", "order-c", "order"]:
+            chamber.write(service, "orderkey", "ordered")
+        capsys.readouterr()
+        chamber.find("orderkey", by_value=False)
+        chamber.find("ordered", by_value=True)
+    assert lines(capsys) == ["Service", "order", "order-c", "order/b"] + [
+        "Service\tKey",
+        "order\torderkey",
+        "order-c\torderkey",
+        "order/b\torderkey",
+    ]
+
+
+@pytest.mark.parametrize("file_index", [False, True])
+@pytest.mark.parametrize("chamber_class", [EnvdirChamber, FileChamber, VaultChamber, SqliteChamber])
+def test_chamber_prefix_matches_path_segments(chamber_class, file_index, config, lines, capsys):
+    if file_index and chamber_class is not FileChamber:
+        pytest.skip("file index applies to the file backend only")
+    config = dict(config, file_index=file_index)
+    with chamber_class(config=config, debug=True, echo=_echo, require_exists=True) as chamber:
+        chamber.write("prefix/app", "key", "app")
+        chamber.write("prefix/app/sub", "key", "app_sub")
+        chamber.write("prefix/apple", "key", "apple")
+    with chamber_class(config=config, debug=True, echo=_echo, require_exists=True) as chamber:
+        assert chamber._list_services("prefix/app") == ["prefix/app", "prefix/app/sub"]
+        assert chamber._list_services("prefix/ap") == []
+        capsys.readouterr()
+        chamber.list_services(service_filter="prefix/app")
+        assert lines(capsys) == ["Service", "prefix/app", "prefix/app/sub"]
+        assert chamber._tree("prefix/app") == {"key": "app", "sub": {"key": "app_sub"}}
+        chamber.prune("prefix/app")
+    with chamber_class(config=config, debug=True, echo=_echo, require_exists=True) as chamber:
+        assert chamber._list_services("prefix") == ["prefix/apple"]
+        chamber.prune("prefix/apple")
+
+
+@pytest.mark.parametrize("chamber_class", [EnvdirChamber, FileChamber])
+def test_chamber_list_owner(chamber_class, config, capsys, lines):
+    with chamber_class(config=config, debug=True, echo=_echo, require_exists=True) as chamber:
+        ret = chamber.list("testservice/sub2")
+    assert ret == 0
+    owners = [line.split()[-1] for line in lines(capsys)[1:]]
+    assert owners == [check_output(["id", "-un"]).decode().strip()] * 2
+
+
+def test_owner_name_unknown_uid():
+    assert _owner_name(2**31 - 2) == str(2**31 - 2)
+
+
+def test_envdir_walk_skips_readme_only_dirs(config, secrets):
+    (secrets / "docs_only").mkdir()
+    (secrets / "docs_only" / "README.md").write_text("not a secret")
+    (secrets / "testservice" / ".hidden").write_text("hidden")
+    with EnvdirChamber(config=config, debug=True, echo=_echo, require_exists=True) as chamber:
+        walked = dict(chamber._walk())
+        assert "docs_only" not in walked
+        assert sorted(walked) == sorted(chamber._list_services())
+        assert ".hidden" in walked["testservice"]
+        assert not chamber._is_service("docs_only")
+
+
+def test_vault_migrate_service_layout(config, capsys):
+    config = dict(config, vault_layout="service")
+    with VaultChamber(config=config, debug=True, echo=_echo, require_exists=True) as chamber:
+        before = {service: chamber._secrets(service) for service in chamber._list_services()}
+        assert chamber.migrate("testservice", "service") == 0
+        assert chamber.secrets.leaves("testservice/sub1") == ["__service__"]
+        assert {service: chamber._secrets(service) for service in chamber._list_services()} == before
+        chamber.write("testservice", "doc_key", "doc_value")
+        assert chamber.secrets.leaves("testservice") == ["__service__"]
+        chamber.delete("testservice", "key1")
+        assert sorted(chamber._secrets("testservice")) == ["doc_key", "dynakey", "fookey", "key_multiword", "testkey"]
+        capsys.readouterr()
+        assert chamber.read("testservice", "doc_key", quiet=True) == 0
+        assert capsys.readouterr().out == "doc_value\n"
+        assert chamber.migrate(None, "key") == 0
+        assert "__service__" not in chamber.secrets.leaves("testservice")
+        assert chamber._secrets("testservice")["doc_key"] == "doc_value"
+
+
+def test_vault_concurrency_is_deterministic(config):
+    results = []
+    for concurrency in [1, 4]:
+        with VaultChamber(config=dict(config, vault_concurrency=concurrency), debug=True, echo=_echo, require_exists=True) as chamber:
+            services = chamber._list_services()
+            results.append(
+                (
+                    services,
+                    [list(chamber._secrets(service).items()) for service in services],
+                    list(chamber._list("testservice")),
+                    json.dumps(chamber.secrets.dump("/")),
+                )
+            )
+    assert results[0] == results[1]
+
+
+def test_vault_list_and_read_request_counts(config, monkeypatch, capsys):
+    with VaultChamber(config=config, debug=True, echo=_echo, require_exists=True) as chamber:
+        reads = []
+        read_secret_version = chamber.secrets.kv.read_secret_version
+
+        def _read_secret_version(*args, **kwargs):
+            reads.append(kwargs["path"])
+            return read_secret_version(*args, **kwargs)
+
+        monkeypatch.setattr(chamber.secrets.kv, "read_secret_version", _read_secret_version)
+        assert chamber.list("testservice/sub2") == 0
+        assert reads == []
+        assert chamber.read("testservice/sub2", "key1") == 0
+        assert reads == ["/testservice/sub2/key1"]
+
+
+def test_vault_round_trips(config, fake_vault):
+    operations = [
+        (lambda chamber: chamber.read("testservice", "key1", quiet=True), 2),
+        (lambda chamber: chamber.env("testservice"), 7),
+        (lambda chamber: chamber.list("testservice"), 7),
+        (lambda chamber: chamber.write("testservice", "key1", "changed"), 1),
+        # the verifying LIST shows there is no service document, so only the DELETE follows
+        (lambda chamber: chamber.delete("testservice", "key1"), 2),
+    ]
+    for operation, limit in operations:
+        with VaultChamber(config=config, debug=True, echo=_echo, require_exists=True) as chamber:
+            fake_vault.reset()
+            assert operation(chamber) == 0
+            assert fake_vault.requests <= limit, dict(fake_vault.counts)
+
+
+def test_vault_walk_lists_each_path_once(config, fake_vault):
+    # the key listings come from the single tree scan, not from a second LIST per service
+    with VaultChamber(config=config, debug=True, echo=_echo, require_exists=True) as chamber:
+        fake_vault.reset()
+        tree = chamber.secrets.tree("/")
+        scan = fake_vault.requests
+    assert scan > len(tree) > 0
+    operations = [
+        lambda chamber: chamber.list_services(include_secrets=True),
+        lambda chamber: chamber.find("key1", by_value=False),
+    ]
+    for operation in operations:
+        with VaultChamber(config=config, debug=True, echo=_echo, require_exists=True) as chamber:
+            fake_vault.reset()
+            assert operation(chamber) == 0
+            assert fake_vault.requests == scan, dict(fake_vault.counts)
+
+
+def test_vault_concurrency_overlaps_round_trips(config, fake_vault):
+    fake_vault.latency = 0.02
+    inflight = []
+    for concurrency in [1, 4]:
+        with VaultChamber(config=dict(config, vault_concurrency=concurrency), debug=True, echo=_echo, require_exists=True) as chamber:
+            fake_vault.reset()
+            assert chamber._secrets("testservice")["key1"] == "value1"
+            inflight.append(fake_vault.max_inflight)
+    assert inflight[0] == 1
+    assert inflight[1] > 1
+
+
+def test_vault_secrets_from_config(config):
+    config = dict(config, root="othermount", token="t0k3n", vault_concurrency=3, vault_timeout=(1.0, 2.0), vault_retries=5)
+    secrets = VaultSecrets.from_config(config)
+    try:
+        assert secrets.base == "othermount"
+        assert secrets.client.token == "t0k3n"
+        adapter = secrets.session.get_adapter("https://vault.example.com")
+        assert adapter._pool_maxsize == 3
+        assert adapter.max_retries.total == 5
+        assert 503 in adapter.max_retries.status_forcelist
+    finally:
+        secrets.close()
+
+
+def test_file_chamber_atomic_save(config, secrets_file):
+    with FileChamber(config=config, debug=True, echo=_echo, require_exists=True) as chamber:
+        chamber.write("testservice", "atomic_key", "atomic_value")
+    assert json.loads(secrets_file.read_text())["testservice"]["atomic_key"] == "atomic_value"
+    assert [f.name for f in secrets_file.parent.iterdir() if f.name.endswith(".tmp")] == []
+
+
+def test_file_chamber_symlinked_file(config, secrets_file, tmp_path):
+    link = tmp_path / "dotfiles" / "link.json"
+    link.parent.mkdir()
+    link.symlink_to(secrets_file)
+    config = dict(config, file=str(link), file_index=True)
+    with FileChamber(config=dict(config, file_journal=True), debug=True, echo=_echo, require_exists=True) as chamber:
+        chamber.write("testservice", "link_key", "journal_value")
+    assert (secrets_file.parent / (secrets_file.name + ".journal")).is_file()
+    with FileChamber(config=config, debug=True, echo=_echo, require_exists=True) as chamber:
+        assert chamber._secrets("testservice")["link_key"] == "journal_value"
+        chamber.write("testservice", "link_key", "linked_value")
+    assert link.is_symlink()
+    assert json.loads(secrets_file.read_text())["testservice"]["link_key"] == "linked_value"
+    assert [f.name for f in link.parent.iterdir()] == ["link.json"]
+
+
+def test_file_chamber_journal(config, secrets_file, monkeypatch):
+    config = dict(config, file_journal=True)
+    journal_file = secrets_file.parent / (secrets_file.name + ".journal")
+    original = secrets_file.read_text()
+    with FileChamber(config=config, debug=True, echo=_echo, require_exists=True) as chamber:
+        chamber.write("testservice", "journal_key", "journal_value")
+        chamber.delete("testservice", "key1")
+    assert secrets_file.read_text() == original
+    assert len(journal_file.read_text().splitlines()) == 2
+
+    # a torn append is skipped on replay and does not corrupt later entries
+    with journal_file.open("a") as ofp:
+        ofp.write('{"op":"write","serv')
+    with FileChamber(config=config, debug=True, echo=_echo, require_exists=True) as chamber:
+        secrets = chamber._secrets("testservice")
+        assert secrets["journal_key"] == "journal_value"
+        assert "key1" not in secrets
+        chamber.write("testservice", "second_key", "second_value")
+    assert json.loads(journal_file.read_text().splitlines()[-1])["key"] == "second_key"
+
+    monkeypatch.setattr("local_chamber.chamber.JOURNAL_COMPACT_ENTRIES", 4)
+    with FileChamber(config=config, debug=True, echo=_echo, require_exists=True) as chamber:
+        chamber.write("testservice", "third_key", "third_value")
+    assert not journal_file.exists()
+    secrets = json.loads(secrets_file.read_text())["testservice"]
+    assert (secrets["journal_key"], secrets["second_key"], secrets["third_key"]) == ("journal_value", "second_value", "third_value")
+    assert "key1" not in secrets
+
+
+def test_file_chamber_journal_write_skips_load(config, secrets_file, monkeypatch):
+    config = dict(config, file_journal=True)
+    monkeypatch.setattr(FileChamber, "_load", lambda self: pytest.fail("journaled write parsed the secrets file"))
+    with FileChamber(config=config, debug=True, echo=_echo, require_exists=True) as chamber:
+        chamber.write("testservice", "lazy_key", "lazy_value")
+        chamber.write_service("lazy_service", {"key": "value"})
+    monkeypatch.undo()
+    with FileChamber(config=config, debug=True, echo=_echo, require_exists=True) as chamber:
+        assert chamber._secrets("testservice")["lazy_key"] == "lazy_value"
+        assert chamber._secrets("lazy_service") == {"key": "value"}
+
+
+def test_file_chamber_compaction_keeps_concurrent_append(config, secrets_file, monkeypatch):
+    config = dict(config, file_journal=True)
+    with FileChamber(config=config, debug=True, echo=_echo, require_exists=True) as late:
+        assert late._secrets("testservice")["key1"] == "value1"
+        # another writer appends to the journal after this one loaded
+        with FileChamber(config=config, debug=True, echo=_echo, require_exists=True) as early:
+            early.write("testservice", "early_key", "early_value")
+        late.write("testservice", "late_key", "late_value")
+        monkeypatch.setattr("local_chamber.chamber.JOURNAL_COMPACT_ENTRIES", 1)
+    assert not secrets_file.with_name(secrets_file.name + ".journal").exists()
+    secrets = json.loads(secrets_file.read_text())["testservice"]
+    assert (secrets["early_key"], secrets["late_key"]) == ("early_value", "late_value")
+
+
+def test_file_chamber_index(config, secrets_file):
+    with FileChamber(config=config, debug=True, echo=_echo, require_exists=True) as chamber:
+        chamber.write("testservice/sub1", "unicode_key_é", "café ☃")
+        chamber.write("testservice/sub1", "tab\tkey", 'quoted "value"')
+    with FileChamber(config=config, debug=True, echo=_echo, require_exists=True) as chamber:
+        services = chamber._list_services()
+        reference = {service: chamber._secrets(service) for service in services}
+
+    index_config = dict(config, file_index=True)
+    index_file = secrets_file.parent / (secrets_file.name + ".index")
+    with FileChamber(config=index_config, debug=True, echo=_echo, require_exists=True) as chamber:
+        assert index_file.is_file()
+        assert {service: chamber._secrets(service) for service in services} == reference
+        assert chamber._read("testservice/sub1", "unicode_key_é")[0] == "café ☃"
+        assert chamber._secrets("testservice/nonexistent") == {}
+        assert chamber.data is None
+        chamber.write("testservice", "index_key", "index_value")
+        assert chamber._read("testservice", "index_key")[0] == "index_value"
+
+    # the rewritten secrets file no longer matches the index header, so it is rebuilt
+    with FileChamber(config=index_config, debug=True, echo=_echo, require_exists=True) as chamber:
+        assert chamber._secrets("testservice")["index_key"] == "index_value"
+        assert chamber.data is None
+
+
+def test_vault_cache(config, shared_datadir, capsys, monkeypatch):
+    cache_dir = shared_datadir / "vault_cache"
+    cached_config = dict(config, vault_cache=True, vault_cache_dir=cache_dir, vault_cache_ttl=60)
+
+    def _env(config, service="testservice"):
+        paths = []
+        with VaultChamber(config=config, debug=True, echo=_echo, require_exists=True) as chamber:
+            request = chamber.secrets.session.request
+            monkeypatch.setattr(
+                chamber.secrets.session, "request", lambda method, url, **kwargs: paths.append(url) or request(method, url, **kwargs)
+            )
+            capsys.readouterr()
+            chamber.env(service)
+        return capsys.readouterr().out, paths
+
+    reference, paths = _env(config)
+    output, paths = _env(cached_config)
+    assert output == reference
+    assert paths
+    entries = list(cache_dir.iterdir())
+    assert len(entries) == 1
+    assert entries[0].stat().st_mode & 0o777 == 0o600
+    assert cache_dir.stat().st_mode & 0o777 == 0o700
+    assert b"value1" not in entries[0].read_bytes()
+
+    output, paths = _env(cached_config)
+    assert output == reference
+    assert paths == []
+
+    # a stale entry whose leaf versions are unchanged is revalidated from metadata alone
+    output, paths = _env(dict(cached_config, vault_cache_ttl=0))
+    assert output == reference
+    assert paths and all("/metadata/" in path for path in paths)
+
+    # a write elsewhere is picked up once the entry is stale, and a cached write invalidates at once
+    with VaultChamber(config=config, debug=True, echo=_echo, require_exists=True) as chamber:
+        chamber.write("testservice", "key1", "uncached")
+    assert "KEY1=value1" in _env(cached_config)[0]
+    assert "KEY1=uncached" in _env(dict(cached_config, vault_cache_ttl=0))[0]
+    with VaultChamber(config=cached_config, debug=True, echo=_echo, require_exists=True) as chamber:
+        chamber.write("testservice", "key1", "cached")
+    assert "KEY1=cached" in _env(cached_config)[0]
+    with VaultChamber(config=config, debug=True, echo=_echo, require_exists=True) as chamber:
+        chamber.write("testservice", "key1", "value1")
+
+    # entries are keyed to the vault token and server
+    with VaultChamber(config=dict(cached_config, token="other-token"), debug=True, echo=_echo, require_exists=True) as chamber:
+        assert chamber.cache.get("testservice") == (None, False)
+    with VaultChamber(config=cached_config, debug=True, echo=_echo, require_exists=True) as chamber:
+        assert chamber.cache.get("testservice")[0] is not None
+        chamber.cache.url = "https://other-vault.example.com:8200"
+        assert chamber.cache.get("testservice") == (None, False)
+
+
+def test_vault_cache_keeps_existing_dir_mode(config, shared_datadir):
+    cache_dir = shared_datadir / "shared_cache"
+    cache_dir.mkdir(mode=0o755)
+    cache_dir.chmod(0o755)
+    cached_config = dict(config, vault_cache=True, vault_cache_dir=cache_dir)
+    with VaultChamber(config=cached_config, debug=True, echo=_echo, require_exists=True) as chamber:
+        chamber.env("testservice")
+    assert len(list(cache_dir.iterdir())) == 1
+    assert cache_dir.stat().st_mode & 0o777 == 0o755
+
+
+def test_sqlite_versions_and_concurrent_reader(config):
+    with SqliteChamber(config=config, debug=True, echo=_echo, require_exists=True) as writer:
+        writer.write("testservice", "key1", "changed")
+        assert writer._secrets("testservice")["key1"] == "changed"
+        # the write transaction is open until exit; another connection reads the committed rows
+        with SqliteChamber(config=config, debug=True, echo=_echo, require_exists=True) as reader:
+            assert reader._secrets("testservice")["key1"] == "value1"
+
+    with SqliteChamber(config=config, debug=True, echo=_echo, require_exists=True) as chamber:
+        assert chamber.db.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert chamber._secrets("testservice")["key1"] == "changed"
+        version, _, owner = chamber._list("testservice")["key1"]
+        assert version == 2
+        assert owner == _owner_name(os.getuid())
+
+
+def test_sqlite_read_reports_version(config, lines, capsys):
+    with SqliteChamber(config=config, debug=True, echo=_echo, require_exists=True) as chamber:
+        chamber.write("testservice", "key1", "changed")
+    with SqliteChamber(config=config, debug=True, echo=_echo, require_exists=True) as chamber:
+        capsys.readouterr()
+        assert chamber.read("testservice", "key1") == 0
+    assert lines(capsys)[1].split("\t")[:3] == ["key1", "changed", "2"]
+
+
+def test_sqlite_subtree_uses_primary_key(config):
+    with SqliteChamber(config=config, debug=True, echo=_echo, require_exists=True) as chamber:
+        chamber.write("testservice2", "key1", "value1")
+        assert chamber._list_services("testservice") == ["testservice", "testservice/sub1", "testservice/sub2"]
+        condition, args = chamber._subtree("testservice")
+        plan = chamber.db.execute(f"EXPLAIN QUERY PLAN SELECT service, key FROM secrets WHERE {condition}", args).fetchall()
+        assert any("SEARCH secrets USING PRIMARY KEY" in row[-1] for row in plan), plan
+        assert not any("SCAN" in row[-1] for row in plan), plan